@@ -0,0 +1,316 @@
+"""
+benchmark.py - Micro-benchmark of the get_transaction_details query path
+
+For each dataset size a fresh worker process generates the data with
+create_db.iter_transactions, loads it into a snapshot and times
+search_transactions (the body of get_transaction_details, without the
+result cache) over a fixed query mix:
+
+    exact        date + time + amount + last4 of a real row
+    fuzzy        same with the wrong last4 (fuzzy fallback hit)
+    miss         real date / time / last4, amount beyond any generated one
+    time_only    date + time
+    amount_only  date + amount
+
+Per kind it reports latency percentiles, the hit rate and the peak bytes
+allocated by one query (tracemalloc, in a separate pass); per size the load
+time and peak RSS. Results go to JSON so runs can be compared across
+commits:
+
+    python benchmark.py --sizes 1000,100000,1000000 --output bench.json
+    python benchmark.py --sizes 1000,100000 --compare bench.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_SIZES = (1_000, 100_000, 1_000_000, 10_000_000)
+QUERY_KINDS = ("exact", "fuzzy", "miss", "time_only", "amount_only")
+
+# The generator needs unique timestamps, so bigger datasets span more days
+ROWS_PER_DAY = 20_000
+
+# Generated amounts are ₹100-5000; this keeps a miss clear of the ±50
+# window for the exact and the fuzzy pass alike
+MISS_OFFSET = 10_000
+
+
+# ==========================================
+# QUERIES
+# ==========================================
+
+def build_queries(rows, per_kind, seed):
+    """{kind: [search_transactions kwargs]} built from sampled rows"""
+    rng = random.Random(seed)
+    queries = {kind: [] for kind in QUERY_KINDS}
+    for txn in rows[:per_kind]:
+        date, time_, amount, last4 = txn["date"], txn["time"], txn["amount"], txn["sender_last4"]
+        wrong_last4 = f"{(int(last4) + rng.randint(1, 9998)) % 10000:04d}"
+        queries["exact"].append(dict(date=date, time=time_, amount=amount, sender_last4=last4))
+        queries["fuzzy"].append(dict(date=date, time=time_, amount=amount, sender_last4=wrong_last4))
+        queries["miss"].append(dict(date=date, time=time_, amount=amount + MISS_OFFSET, sender_last4=last4))
+        queries["time_only"].append(dict(date=date, time=time_))
+        queries["amount_only"].append(dict(date=date, amount=amount))
+    return queries
+
+
+def sampled(transactions, count, seed, into):
+    """Pass rows through unchanged, keeping a uniform sample of `count` in `into`"""
+    rng = random.Random(seed)
+    for seen, txn in enumerate(transactions):
+        if len(into) < count:
+            into.append(txn)
+        else:
+            slot = rng.randrange(seen + 1)
+            if slot < count:
+                into[slot] = txn
+        yield txn
+
+
+# ==========================================
+# MEASUREMENT
+# ==========================================
+
+def rss_bytes():
+    """(current, peak) resident set size of this process"""
+    current = None
+    try:
+        with open("/proc/self/statm") as f:
+            current = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        peak = peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        peak = None
+    return current, peak
+
+
+def percentiles(values):
+    values = sorted(values)
+    count = len(values)
+
+    def at(q):
+        return values[min(count - 1, int(q * count))]
+
+    return {
+        "mean": sum(values) / count,
+        "p50": at(0.50),
+        "p95": at(0.95),
+        "p99": at(0.99),
+        "max": values[-1],
+    }
+
+
+def load_snapshot(size, backend, seed, sample, workdir):
+    from create_db import iter_transactions
+    from transaction_store import TransactionSnapshot
+
+    days = max(30, size // ROWS_PER_DAY)
+    rows = sampled(iter_transactions(size, days=days, seed=seed), sample["count"], seed,
+                   sample["rows"])
+    if backend == "sqlite":
+        from storage import SqliteSnapshot, write_sqlite
+        path = os.path.join(workdir, "transactions.db")
+        write_sqlite(rows, path)
+        started = time.perf_counter()
+        snapshot = SqliteSnapshot(path)
+        return snapshot, time.perf_counter() - started
+    if backend == "binary":
+        from binary_snapshot import MappedSnapshot, write_binary_snapshot
+        path = os.path.join(workdir, "transactions.snap")
+        write_binary_snapshot(rows, path)
+        started = time.perf_counter()
+        snapshot = MappedSnapshot(path)
+        return snapshot, time.perf_counter() - started
+    if backend == "partitioned":
+        from partitions import PartitionedBackend, write_partitions
+        path = os.path.join(workdir, "transactions")
+        write_partitions(rows, path)
+        started = time.perf_counter()
+        snapshot = PartitionedBackend(path).load(version=1, signature=None)
+        return snapshot, time.perf_counter() - started
+    started = time.perf_counter()
+    snapshot = TransactionSnapshot(rows)
+    # Includes generating the rows; they are never materialised as a list
+    return snapshot, time.perf_counter() - started
+
+
+def run_size(size, backend, per_kind, repeat, seed):
+    """Benchmark one dataset size in this process; returns its result dict"""
+    os.environ.setdefault("UPI_LOG_LEVEL", "WARNING")
+    from server import search_transactions
+
+    sample = {"count": per_kind, "rows": []}
+    with tempfile.TemporaryDirectory(prefix="upi_bench_") as workdir:
+        snapshot, load_seconds = load_snapshot(size, backend, seed, sample, workdir)
+        rss_loaded, _ = rss_bytes()
+        queries = build_queries(sample["rows"], per_kind, seed)
+
+        # Warm-up: first touches of lazily built structures are not timed
+        for batch in queries.values():
+            for query in batch:
+                search_transactions(snapshot, **query)
+
+        kinds = {}
+        for kind, batch in queries.items():
+            latencies, hits = [], 0
+            for _ in range(repeat):
+                for query in batch:
+                    started = time.perf_counter()
+                    response = search_transactions(snapshot, **query)
+                    latencies.append(time.perf_counter() - started)
+                    hits += bool(response["success"])
+            kinds[kind] = {
+                "queries": len(latencies),
+                "hit_rate": round(hits / len(latencies), 4),
+                "latency_us": {k: round(v * 1e6, 2) for k, v in percentiles(latencies).items()},
+            }
+
+        # Allocation pass, kept apart because tracing slows every allocation
+        tracemalloc.start()
+        for kind, batch in queries.items():
+            peaks = []
+            for query in batch:
+                tracemalloc.reset_peak()
+                before, _ = tracemalloc.get_traced_memory()
+                search_transactions(snapshot, **query)
+                peaks.append(tracemalloc.get_traced_memory()[1] - before)
+            kinds[kind]["alloc_peak_bytes"] = {
+                "mean": round(sum(peaks) / len(peaks)),
+                "max": max(peaks),
+            }
+        tracemalloc.stop()
+
+        _, rss_peak = rss_bytes()
+        nbytes = snapshot.nbytes() if hasattr(snapshot, "nbytes") else None
+        return {
+            "rows": len(snapshot),
+            "backend": backend,
+            "load_s": round(load_seconds, 3),
+            "snapshot_bytes": nbytes,
+            "rss_loaded_bytes": rss_loaded,
+            "rss_peak_bytes": rss_peak,
+            "kinds": kinds,
+        }
+
+
+def run_worker(size, args):
+    """run_size in a fresh interpreter so peak RSS belongs to this size only"""
+    command = [
+        sys.executable, os.path.abspath(__file__), "--worker", str(size),
+        "--backend", args.backend, "--per-kind", str(args.per_kind),
+        "--repeat", str(args.repeat), "--seed", str(args.seed),
+    ]
+    output = subprocess.run(command, cwd=BASE_DIR, check=True, capture_output=True, text=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+# ==========================================
+# REPORT
+# ==========================================
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    from transaction_store import QUERY_ENGINE, np
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "query_engine": QUERY_ENGINE,
+        "numpy": np.__version__ if np is not None else None,
+    }
+
+
+def _mb(value):
+    return f"{value / 2**20:.0f}" if value is not None else "-"
+
+
+def print_results(results, baseline=None):
+    print("=" * 78)
+    print(f" {'rows':>10}  {'kind':<12} {'p50 µs':>9} {'p95 µs':>9} {'p99 µs':>9} "
+          f"{'hit':>5} {'alloc KB':>9}  {'vs base':>8}")
+    print("=" * 78)
+    base = {(r["rows"], r["backend"]): r for r in (baseline or {}).get("results", [])}
+    for result in results:
+        for kind, stats in result["kinds"].items():
+            latency = stats["latency_us"]
+            change = ""
+            old = base.get((result["rows"], result["backend"]), {}).get("kinds", {}).get(kind)
+            if old:
+                change = f"{latency['p50'] / old['latency_us']['p50']:.2f}x"
+            print(f" {result['rows']:>10}  {kind:<12} {latency['p50']:>9.1f} {latency['p95']:>9.1f} "
+                  f"{latency['p99']:>9.1f} {stats['hit_rate']:>5.2f} "
+                  f"{stats['alloc_peak_bytes']['mean'] / 1024:>9.1f}  {change:>8}")
+        print(f" {'':>10}  load {result['load_s']} s, snapshot {_mb(result['snapshot_bytes'])} MB, "
+              f"RSS {_mb(result['rss_loaded_bytes'])} MB (peak {_mb(result['rss_peak_bytes'])} MB)")
+
+
+# ==========================================
+# MAIN
+# ==========================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the transaction query path")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES),
+                        help="comma-separated dataset sizes")
+    parser.add_argument("--backend", choices=["memory", "sqlite", "binary", "partitioned"], default="memory")
+    parser.add_argument("--per-kind", type=int, default=200, help="distinct queries per kind")
+    parser.add_argument("--repeat", type=int, default=5, help="timed passes over the query mix")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default=None, help="write results as JSON")
+    parser.add_argument("--compare", default=None, help="earlier --output file to compare p50 against")
+    parser.add_argument("--worker", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker is not None:
+        result = run_size(args.worker, args.backend, args.per_kind, args.repeat, args.seed)
+        print(json.dumps(result))
+        return 0
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    results = []
+    for size in sizes:
+        print(f" Benchmarking {size} rows ({args.backend})...", flush=True)
+        results.append(run_worker(size, args))
+
+    report = {"environment": environment(), "config": vars(args), "results": results}
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f" Results saved to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,243 @@
+"""
+binary_snapshot.py - Memory-mapped transaction snapshot files (*.snap)
+
+A snapshot file holds the encoded columns and the per-date indexes of
+transaction_store.py, so the server maps it instead of parsing JSON:
+startup reads only the header, and every worker process mapping the same
+file shares one copy in the page cache.
+
+Layout (arrays in the writer's byte order, recorded in the header and
+checked on open; sections 8-byte aligned):
+
+    b"UPISNAP1"                          magic
+    uint64                               header length
+    header (JSON)                        row count, section table, category
+                                         values, overflow, date directory
+    sections                             fixed-width arrays:
+        date_ordinals  int32   day ordinal
+        seconds        int32   seconds since midnight (-1 = invalid)
+        amounts        float64 rupees (NaN = non-numeric)
+        <field>.codes  int32   dictionary codes (sender_last4, status, ...)
+        txn_ids / receiver_accounts          UTF-8 string table + int64 offsets
+        index.*                              per-date row ids, sorted by
+                                             time / amount / last4 code
+
+Columns are exposed as memoryview slices of the mapping (zero copy), so
+TransactionIndex runs on them unchanged.
+
+    python create_db.py --format binary
+    UPI_TRANSACTIONS_PATH=transactions.snap python server.py
+"""
+
+import json
+import mmap
+import os
+import sys
+import time
+from array import array
+
+from transaction_store import (
+    TransactionColumns,
+    TransactionIndex,
+    TransactionSnapshot,
+    _DateIndex,
+    _DictColumn,
+    _StringColumn,
+)
+
+MAGIC = b"UPISNAP1"
+FORMAT_VERSION = 1
+SNAPSHOT_EXTENSIONS = (".snap",)
+
+_ALIGN = 8
+_INDEX_SECTIONS = (
+    ("rows", "i"),
+    ("seconds", "i"), ("seconds_rows", "i"),
+    ("amounts", "d"), ("amount_rows", "i"),
+    ("last4_codes", "i"), ("last4_rows", "i"),
+)
+
+
+def _padding(offset):
+    return -offset % _ALIGN
+
+
+# ==========================================
+# WRITER
+# ==========================================
+
+def write_binary_snapshot(transactions, path):
+    """
+    Encode transactions (any iterable of dicts) into a snapshot file.
+
+    The rows are indexed in memory exactly as the JSON backend would, then
+    written next to the target and moved into place, so a running server
+    never maps a half-written file. Returns the row count.
+    """
+    snapshot = TransactionSnapshot(transactions)
+    columns, index = snapshot.columns, snapshot.index
+
+    sections = [
+        ("date_ordinals", columns.date_ordinals),
+        ("seconds", columns.seconds),
+        ("amounts", columns.amounts),
+        ("txn_ids.data", columns.txn_ids._data),
+        ("txn_ids.offsets", columns.txn_ids._offsets),
+        ("receiver_accounts.data", columns.receiver_accounts._data),
+        ("receiver_accounts.offsets", columns.receiver_accounts._offsets),
+    ]
+    for field, column in columns.categories.items():
+        sections.append((f"{field}.codes", column.codes))
+
+    # All dates' index arrays back to back; the directory holds the slices
+    merged = {name: array(typecode) for name, typecode in _INDEX_SECTIONS}
+    dates = []
+    for date, date_index in index.by_date.items():
+        entry = [date]
+        for name, _ in _INDEX_SECTIONS:
+            values = getattr(date_index, name)
+            entry += [len(merged[name]), len(values)]
+            merged[name].extend(values)
+        dates.append(entry)
+    sections += [(f"index.{name}", merged[name]) for name, _ in _INDEX_SECTIONS]
+
+    table, offset = {}, 0
+    for name, values in sections:
+        typecode = values.typecode if isinstance(values, array) else "B"
+        table[name] = [offset, typecode, len(values)]
+        nbytes = len(memoryview(values).cast("B"))
+        offset += nbytes + _padding(nbytes)
+
+    header = json.dumps({
+        "format": FORMAT_VERSION,
+        "byteorder": sys.byteorder,
+        "count": len(columns),
+        "sections": table,
+        "categories": {field: column.values for field, column in columns.categories.items()},
+        "overflow": {str(row): values for row, values in columns.overflow.items()},
+        "dates": dates,
+    }, separators=(",", ":")).encode()
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(len(header).to_bytes(8, "little"))
+        f.write(header)
+        f.write(b"\0" * _padding(len(MAGIC) + 8 + len(header)))
+        for _, values in sections:
+            data = memoryview(values).cast("B")
+            f.write(data)
+            f.write(b"\0" * _padding(len(data)))
+    os.replace(tmp_path, path)
+    return len(columns)
+
+
+# ==========================================
+# READER
+# ==========================================
+
+class _MappedStringColumn(_StringColumn):
+    """_StringColumn over a mapped UTF-8 buffer"""
+
+    __slots__ = ()
+
+    def __init__(self, data, offsets):
+        self._data = data
+        self._offsets = offsets
+
+    def __getitem__(self, row):
+        return str(self._data[self._offsets[row]:self._offsets[row + 1]], "utf-8")
+
+
+class _MappedDateIndex(_DateIndex):
+    """_DateIndex whose sorted arrays are slices of the mapping"""
+
+    __slots__ = ()
+
+    def __init__(self, arrays):
+        for name, values in arrays.items():
+            setattr(self, name, values)
+
+
+class MappedColumns(TransactionColumns):
+    """TransactionColumns backed by a snapshot file's sections (read-only)"""
+
+    def __init__(self, count, sections, categories, overflow):
+        self.date_ordinals = sections["date_ordinals"]
+        self.seconds = sections["seconds"]
+        self.amounts = sections["amounts"]
+        self.txn_ids = _MappedStringColumn(sections["txn_ids.data"], sections["txn_ids.offsets"])
+        self.receiver_accounts = _MappedStringColumn(
+            sections["receiver_accounts.data"], sections["receiver_accounts.offsets"]
+        )
+        self.categories = {}
+        for field, values in categories.items():
+            column = _DictColumn()
+            for value in values:
+                column.encode(value)
+            column.codes = sections[f"{field}.codes"]
+            self.categories[field] = column
+        self.overflow = overflow
+        self._date_strings = {}
+        self._numpy = None
+        self._count = count
+
+    def append(self, txn):
+        raise TypeError("Snapshot files are read-only")
+
+
+class MappedSnapshot(TransactionSnapshot):
+    """
+    TransactionSnapshot served straight from a memory-mapped snapshot file.
+
+    Opening costs one header parse; rows are paged in as queries touch them.
+    """
+
+    def __init__(self, path, version=0, signature=None):
+        with open(path, "rb") as f:
+            try:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # empty file
+                raise ValueError(f"{path} is empty") from None
+        buffer = memoryview(self._mmap)
+
+        if bytes(buffer[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{path} is not a transaction snapshot file")
+        header_end = len(MAGIC) + 8 + int.from_bytes(buffer[len(MAGIC):len(MAGIC) + 8], "little")
+        header = json.loads(bytes(buffer[len(MAGIC) + 8:header_end]))
+        if header.get("format") != FORMAT_VERSION or header.get("byteorder") != sys.byteorder:
+            raise ValueError(f"{path}: unsupported snapshot format or byte order")
+
+        data_start = header_end + _padding(header_end)
+        sections = {}
+        for name, (offset, typecode, length) in header["sections"].items():
+            start = data_start + offset
+            size = length * array(typecode).itemsize
+            if start + size > len(buffer):
+                raise ValueError(f"{path} is truncated")
+            sections[name] = buffer[start:start + size].cast(typecode)
+
+        self.columns = MappedColumns(
+            header["count"],
+            sections,
+            header["categories"],
+            {int(row): values for row, values in header["overflow"].items()},
+        )
+
+        by_date = {}
+        for entry in header["dates"]:
+            arrays = {}
+            for position, (name, _) in enumerate(_INDEX_SECTIONS):
+                start, length = entry[1 + 2 * position], entry[2 + 2 * position]
+                arrays[name] = sections[f"index.{name}"][start:start + length]
+            by_date[entry[0]] = _MappedDateIndex(arrays)
+        self.index = TransactionIndex(self.columns, by_date=by_date)
+
+        self.path = path
+        self.version = version
+        self.signature = signature
+        self.loaded_at = time.time()
+
+    def mapped_bytes(self):
+        """Size of the mapping (shared page cache, not private memory)"""
+        return len(self._mmap)
@@ -0,0 +1,136 @@
+"""
+conversations.py - Checkpointed conversation state for the payment agent
+
+The compiled graph keeps each chat's state in a LangGraph checkpointer keyed
+by thread id, so a turn only sends the new user message. Two tiers:
+
+    memory  InMemorySaver used by the graph itself, latest checkpoint only
+    disk    SqliteSaver, written once at the end of every turn
+
+Threads idle for longer than `idle_seconds` are dropped from memory and
+restored from disk on their next turn; after a restart every open
+conversation is still on disk.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.checkpoint.sqlite import SqliteSaver
+from upi_agent.instrumentation import get_logger
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Empty string keeps conversations in memory only
+CONVERSATIONS_DB = os.environ.get(
+    "UPI_CONVERSATIONS_DB", os.path.join(BASE_DIR, "conversations.db")
+)
+IDLE_SECONDS = float(os.environ.get("UPI_SESSION_IDLE_SECONDS", 1800))
+
+log = get_logger("conversations")
+
+
+def thread_config(thread_id):
+    return {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+
+
+def _copy_checkpoint(saved, target):
+    """Write a CheckpointTuple into another checkpointer as that thread's only state"""
+    config = thread_config(saved.config["configurable"]["thread_id"])
+    checkpoint = saved.checkpoint
+    return target.put(config, checkpoint, saved.metadata, checkpoint["channel_versions"])
+
+
+class ConversationStore:
+    """Checkpointer for the agent graph plus disk spill for idle threads"""
+
+    def __init__(self, db_path=CONVERSATIONS_DB, idle_seconds=IDLE_SECONDS):
+        self.memory = InMemorySaver()
+        self.disk = None
+        if db_path:
+            self.disk = SqliteSaver(sqlite3.connect(db_path, check_same_thread=False))
+            self.disk.setup()
+        self.db_path = db_path
+        self.idle_seconds = idle_seconds
+        self._last_seen = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    @property
+    def checkpointer(self):
+        return self.memory
+
+    def open(self, thread_id):
+        """Run config for a turn on `thread_id`, restored from disk if evicted"""
+        config = thread_config(thread_id)
+        if self.disk is not None and self.memory.get_tuple(config) is None:
+            saved = self.disk.get_tuple(config)
+            if saved is not None:
+                _copy_checkpoint(saved, self.memory)
+        with self._lock:
+            self._last_seen[thread_id] = time.monotonic()
+        return config
+
+    def persist(self, thread_id):
+        """After a turn: save the thread to disk and drop its older checkpoints"""
+        config = thread_config(thread_id)
+        latest = self.memory.get_tuple(config)
+        if latest is None:
+            return
+        if self.disk is not None:
+            _copy_checkpoint(latest, self.disk)
+            with self.disk.lock, self.disk.conn:
+                for table in ("checkpoints", "writes"):
+                    self.disk.conn.execute(
+                        f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_id != ?",
+                        (thread_id, latest.checkpoint["id"]),
+                    )
+        # The graph only ever resumes from the latest checkpoint
+        self.memory.delete_thread(thread_id)
+        _copy_checkpoint(latest, self.memory)
+
+        with self._lock:
+            self._last_seen[thread_id] = time.monotonic()
+            sweep = time.monotonic() - self._last_sweep >= min(self.idle_seconds, 60)
+        if sweep:
+            self.evict_idle()
+
+    def evict_idle(self, idle_seconds=None):
+        """Drop threads idle for `idle_seconds` from memory; they stay on disk"""
+        if self.disk is None:
+            return 0
+        idle_seconds = self.idle_seconds if idle_seconds is None else idle_seconds
+        now = time.monotonic()
+        with self._lock:
+            self._last_sweep = now
+            idle = [t for t, seen in self._last_seen.items() if now - seen >= idle_seconds]
+            for thread_id in idle:
+                del self._last_seen[thread_id]
+        for thread_id in idle:
+            self.memory.delete_thread(thread_id)
+        if idle:
+            log.info(" Evicted %d idle conversation(s) to %s", len(idle), self.db_path)
+        return len(idle)
+
+    def delete(self, thread_id):
+        """Forget a conversation everywhere (e.g. grievance closed)"""
+        with self._lock:
+            self._last_seen.pop(thread_id, None)
+        self.memory.delete_thread(thread_id)
+        if self.disk is not None:
+            self.disk.delete_thread(thread_id)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_conversation_store():
+    """Process-wide ConversationStore, opened on first use"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ConversationStore()
+        return _store
@@ -1,112 +1,190 @@
-
-
+import argparse
 import json
+import math
 import os
 import random
 from datetime import datetime, timedelta
 
+from partitions import write_partitions
+from storage import (
+    iter_transactions_file,
+    migrate_json_to_binary,
+    migrate_json_to_sqlite,
+    write_binary_snapshot,
+    write_sqlite,
+)
+
 # -----------------------------
-# DB PATH (JSON)
+# DB PATH (JSON / SQLITE)
 # -----------------------------
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 JSON_PATH = os.path.join(BASE_DIR, "transactions.json")
+JSONL_PATH = os.path.join(BASE_DIR, "transactions.jsonl")
+SQLITE_PATH = os.path.join(BASE_DIR, "transactions.db")
+BINARY_PATH = os.path.join(BASE_DIR, "transactions.snap")
+PARTITIONS_PATH = os.path.join(BASE_DIR, "transactions")
+
+SECONDS_PER_DAY = 86400
+
+SENDER_BANKS = ["SBI", "HDFC", "ICICI", "AXIS", "PNB"]
+RECEIVER_BANKS = ["SBI", "HDFC", "ICICI", "AXIS", "PNB"]
+STATUSES = ["SUCCESS", "FAILED", "PENDING"]
+DESCRIPTIONS = {
+    "SUCCESS": "Transaction completed successfully",
+    "FAILED": "Transaction failed",
+    "PENDING": "Transaction pending",
+}
 
 # -----------------------------
 # GENERATE TRANSACTIONS
 # -----------------------------
-def generate_transactions(count=200):
-    sender_banks = ["SBI", "HDFC", "ICICI", "AXIS", "PNB"]
-    receiver_banks = ["SBI", "HDFC", "ICICI", "AXIS", "PNB"]
-    statuses = ["SUCCESS", "FAILED", "PENDING"]
-
-    transactions = []
-    used_datetimes = set()  # ensure uniqueness
-
-    for i in range(1, count + 1):
-        txn_id = f"TXN{i:04d}"
-
-        # 🔹 Random date within last 30 days
-        random_days = random.randint(0, 30)
-        base_date = datetime.now() - timedelta(days=random_days)
-
-        # 🔹 Generate UNIQUE time
-        while True:
-            random_seconds = random.randint(0, 86399)  # seconds in a day
-            dt = base_date.replace(
-                hour=0, minute=0, second=0, microsecond=0
-            ) + timedelta(seconds=random_seconds)
-
-            key = dt.strftime("%Y-%m-%d %H:%M:%S")
-            if key not in used_datetimes:
-                used_datetimes.add(key)
-                break
-
-        date = dt.strftime("%Y-%m-%d")
-        time = dt.strftime("%H:%M:%S")
-
-        amount = round(random.uniform(100, 5000), 2)
-        sender_last4 = str(random.randint(1000, 9999))
-        receiver_account_no = str(random.randint(7000000000, 9999999999))
-        receiver_bank = random.choice(receiver_banks)
-        sender_bank = random.choice(sender_banks)
-        status = random.choice(statuses)
-
-        description = (
-            "Transaction completed successfully"
-            if status == "SUCCESS"
-            else "Transaction failed"
-            if status == "FAILED"
-            else "Transaction pending"
+def _binomial(rng, n, p):
+    """Binomial(n, p) draw; normal approximation once n is large"""
+    if n < 1000:
+        return sum(1 for _ in range(n) if rng.random() < p)
+    sigma = math.sqrt(n * p * (1 - p))
+    return min(n, max(0, round(rng.gauss(n * p, sigma))))
+
+
+def iter_transactions(count=200, days=30, seed=None, end_date=None):
+    """
+    Stream `count` transactions spread over the last `days` + 1 days.
+
+    Memory stays constant in `count`: each day's share is drawn up front,
+    then that day's timestamps are sampled without replacement from its
+    86,400 seconds, so every (date, time) is unique with no retry loop.
+    Rows come out day by day in chronological order. Pass `seed` for a
+    reproducible dataset.
+    """
+    total_days = days + 1
+    if count > total_days * SECONDS_PER_DAY:
+        raise ValueError(
+            f"Cannot fit {count} unique timestamps into {total_days} days"
         )
 
-        transaction = {
-            "txn_id": txn_id,
-            "date": date,
-            "time": time,
-            "amount": amount,
-            "sender_last4": sender_last4,
-            "receiver_account_no": receiver_account_no,
-            "receiver_bank_name": receiver_bank,
-            "sender_bank_name": sender_bank,
-            "status": status,
-            "description": description
-        }
-
-        transactions.append(transaction)
-
-    return transactions
+    rng = random.Random(seed)
+    end_date = end_date or datetime.now()
+    first_day = (end_date - timedelta(days=days)).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+
+    txn_no = 0
+    remaining = count
+    for day in range(total_days):
+        days_left = total_days - day
+        if days_left == 1:
+            day_count = remaining
+        else:
+            day_count = _binomial(rng, remaining, 1 / days_left)
+            # Never leave more rows than the remaining days can hold
+            day_count = max(day_count, remaining - (days_left - 1) * SECONDS_PER_DAY)
+            day_count = min(day_count, SECONDS_PER_DAY)
+        remaining -= day_count
+
+        date = (first_day + timedelta(days=day)).strftime("%Y-%m-%d")
+        for seconds in sorted(rng.sample(range(SECONDS_PER_DAY), day_count)):
+            txn_no += 1
+            status = rng.choice(STATUSES)
+            yield {
+                "txn_id": f"TXN{txn_no:04d}",
+                "date": date,
+                "time": f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}",
+                "amount": round(rng.uniform(100, 5000), 2),
+                "sender_last4": str(rng.randint(1000, 9999)),
+                "receiver_account_no": str(rng.randint(7000000000, 9999999999)),
+                "receiver_bank_name": rng.choice(RECEIVER_BANKS),
+                "sender_bank_name": rng.choice(SENDER_BANKS),
+                "status": status,
+                "description": DESCRIPTIONS[status],
+            }
+
+
+def generate_transactions(count=200, seed=None):
+    return list(iter_transactions(count, seed=seed))
 
 # -----------------------------
 # SAVE TO JSON
 # -----------------------------
-def save_to_json(transactions):
-    with open(JSON_PATH, "w") as f:
+def save_to_json(transactions, path=JSON_PATH):
+    with open(path, "w") as f:
         json.dump(transactions, f, indent=4)
-    print(f" {len(transactions)} transactions saved to {JSON_PATH}")
+    print(f" {len(transactions)} transactions saved to {path}")
+
+
+def save_to_jsonl(transactions, path=JSONL_PATH, chunk_size=10000):
+    """Write one compact JSON object per line, `chunk_size` rows per write"""
+    count = 0
+    chunk = []
+    with open(path, "w") as f:
+        for txn in transactions:
+            chunk.append(json.dumps(txn, separators=(",", ":")))
+            if len(chunk) >= chunk_size:
+                f.write("\n".join(chunk) + "\n")
+                count += len(chunk)
+                chunk = []
+        if chunk:
+            f.write("\n".join(chunk) + "\n")
+            count += len(chunk)
+    print(f" {count} transactions saved to {path}")
+    return count
 
 # -----------------------------
 # MAIN
 # -----------------------------
 if __name__ == "__main__":
-    transactions = generate_transactions(200)
-    save_to_json(transactions)
-    print(" transactions.json is ready for your payment agent!")
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+    parser = argparse.ArgumentParser(description="Create the transactions database")
+    parser.add_argument("--count", type=int, default=200,
+                        help="number of transactions to generate")
+    parser.add_argument("--days", type=int, default=30,
+                        help="spread transactions over the last N days")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="random seed for a reproducible dataset")
+    parser.add_argument("--format", choices=["json", "jsonl", "sqlite", "binary"], default="json",
+                        help="json (indented, in memory), streamed jsonl / sqlite, "
+                             "or a memory-mappable binary snapshot")
+    parser.add_argument("--migrate", action="store_true",
+                        help="convert the existing transactions.json into SQLite "
+                             "(or a binary snapshot with --format binary) instead")
+    parser.add_argument("--partitioned", action="store_true",
+                        help="one file per day (binary, or jsonl with --format jsonl) "
+                             "in a directory, loaded lazily by the server")
+    parser.add_argument("--output", default=None,
+                        help="output path (default: transactions.<format> in this folder)")
+    args = parser.parse_args()
+
+    if args.partitioned:
+        output = args.output or PARTITIONS_PATH
+        file_format = "jsonl" if args.format == "jsonl" else "binary"
+        if args.migrate:
+            transactions = iter_transactions_file(JSON_PATH)
+        else:
+            transactions = iter_transactions(args.count, args.days, args.seed)
+        count = write_partitions(transactions, output, file_format)
+        print(f" {count} transactions saved to {output}/ ({file_format}, one file per day)")
+        print(f" Start the server with UPI_TRANSACTIONS_PATH={output}")
+    elif args.migrate:
+        if args.format == "binary":
+            output = args.output or BINARY_PATH
+            migrate_json_to_binary(JSON_PATH, output)
+        else:
+            output = args.output or SQLITE_PATH
+            migrate_json_to_sqlite(JSON_PATH, output)
+        print(f" Start the server with UPI_TRANSACTIONS_PATH={output}")
+    elif args.format == "json":
+        transactions = list(iter_transactions(args.count, args.days, args.seed))
+        save_to_json(transactions, args.output or JSON_PATH)
+        print(" transactions.json is ready for your payment agent!")
+    else:
+        transactions = iter_transactions(args.count, args.days, args.seed)
+        if args.format == "jsonl":
+            output = args.output or JSONL_PATH
+            save_to_jsonl(transactions, output)
+        elif args.format == "binary":
+            output = args.output or BINARY_PATH
+            count = write_binary_snapshot(transactions, output)
+            print(f" {count} transactions saved to {output}")
+        else:
+            output = args.output or SQLITE_PATH
+            count = write_sqlite(transactions, output)
+            print(f" {count} transactions saved to {output}")
+        print(f" Start the server with UPI_TRANSACTIONS_PATH={output}")
@@ -0,0 +1,130 @@
+"""
+history.py - Token-budgeted chat history for the decision LLM
+
+Instead of every earlier message verbatim, the prompt gets at most
+HISTORY_TOKEN_BUDGET tokens of:
+
+    Collected details   date / time / amount / last4 gathered so far
+    Earlier results     one-line summaries of older tool results
+    Recent conversation the last RECENT_TURNS user turns, tool dumps summarised
+
+Messages are walked newest first and the walk stops once the budget is
+spent, so prompt size (and the work to build it) stays flat however long
+the conversation runs.
+"""
+
+import json
+import os
+
+HISTORY_TOKEN_BUDGET = int(os.environ.get("UPI_HISTORY_TOKENS", 1200))
+RECENT_TURNS = int(os.environ.get("UPI_HISTORY_TURNS", 3))
+MAX_TOOL_SUMMARIES = 3
+MAX_MESSAGE_TOKENS = 200
+# Older messages than this are never looked at
+MAX_SCAN_MESSAGES = 60
+
+SLOT_LABELS = {
+    "date": "date",
+    "time": "time",
+    "amount": "amount",
+    "sender_last4": "last4",
+}
+
+_ROLES = {"human": "User", "ai": "Assistant", "tool": "Tool result"}
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token), no tokenizer needed"""
+    return len(text) // 4 + 1
+
+
+def _clip(text, max_tokens):
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    return text[: max_tokens * 4].rstrip() + " …"
+
+
+def _content(message):
+    if hasattr(message, "content"):
+        return message.content if isinstance(message.content, str) else str(message.content)
+    return str(message)
+
+
+def tool_result_payload(message):
+    """Parsed get_transaction_details payload of a ToolMessage, or None"""
+    payload = getattr(message, "artifact", None)
+    if isinstance(payload, dict):
+        return payload
+    try:
+        payload = json.loads(_content(message))
+    except (TypeError, ValueError):
+        return None
+    return payload if isinstance(payload, dict) else None
+
+
+def summarize_tool_result(message, max_transactions=3):
+    """One line per tool result: outcome plus the key fields of each transaction"""
+    payload = tool_result_payload(message)
+    if payload is None:
+        return _clip(_content(message), MAX_MESSAGE_TOKENS // 2)
+    if "error" in payload and "message" not in payload:
+        return f"error: {payload['error']}"
+
+    parts = [payload.get("message") or ("success" if payload.get("success") else "failed")]
+    transactions = payload.get("transactions") or []
+    for txn in transactions[:max_transactions]:
+        parts.append(
+            f"{txn.get('txn_id')} {txn.get('date')} {txn.get('time')} "
+            f"₹{txn.get('amount')} last4 {txn.get('sender_last4')} {txn.get('status')}"
+        )
+    if len(transactions) > max_transactions:
+        parts.append(f"+{len(transactions) - max_transactions} more")
+    return "; ".join(parts)
+
+
+def render_slots(slots):
+    filled = [
+        f"{label}={slots[name]}"
+        for name, label in SLOT_LABELS.items()
+        if slots and slots.get(name) not in (None, "")
+    ]
+    return "Collected details: " + ", ".join(filled) if filled else ""
+
+
+def render_history(messages, slots=None, budget=HISTORY_TOKEN_BUDGET,
+                   recent_turns=RECENT_TURNS):
+    """Compact, budgeted history text for the messages before the current input"""
+    header = render_slots(slots)
+    used = estimate_tokens(header) if header else 0
+    recent, earlier = [], []
+    turns = 0
+
+    for message in reversed(messages[-MAX_SCAN_MESSAGES:]):
+        in_recent = turns < recent_turns
+        if not in_recent and len(earlier) >= MAX_TOOL_SUMMARIES:
+            break
+        kind = getattr(message, "type", "human")
+        if kind == "tool":
+            line = summarize_tool_result(message)
+        elif in_recent:
+            line = _clip(_content(message), MAX_MESSAGE_TOKENS)
+        else:
+            continue
+
+        cost = estimate_tokens(line) + 2
+        if used + cost > budget:
+            break
+        used += cost
+        if in_recent:
+            recent.append(f"{_ROLES.get(kind, kind)}: {line}")
+        else:
+            earlier.append(f"- {line}")
+        if kind == "human":
+            turns += 1
+
+    sections = [header] if header else []
+    if earlier:
+        sections.append("Earlier results:\n" + "\n".join(reversed(earlier)))
+    if recent:
+        sections.append("Recent conversation:\n" + "\n".join(reversed(recent)))
+    return "\n\n".join(sections) or "(none)"
@@ -0,0 +1,145 @@
+"""
+ingest.py - Append-only ingestion into the running transaction store
+
+The transaction feed appends JSON Lines (one transaction per line) to a log
+file, UPI_INGEST_LOG. The server tails it: each poll reads the complete
+lines added since the last one and hands them to TransactionStore.ingest,
+which indexes only those rows. New transactions become searchable within
+UPI_INGEST_POLL seconds, without a reload. A partial last line is left for
+the next poll. If the log is truncated or replaced, the ingested rows are
+dropped and the log is read again from the start.
+
+    UPI_INGEST_LOG=incoming.jsonl python server.py
+    echo '{"txn_id": "TXN...", "date": "2024-12-23", ...}' >> incoming.jsonl
+"""
+
+import json
+import os
+import threading
+
+from instrumentation import get_logger
+
+INGEST_LOG = os.environ.get("UPI_INGEST_LOG") or None
+INGEST_POLL_INTERVAL = float(os.environ.get("UPI_INGEST_POLL", 0.5))
+
+# Bytes read per batch, so one poll after a burst stays bounded
+MAX_READ_BYTES = 4 * 1024 * 1024
+
+log = get_logger("ingest")
+
+
+class IngestLog:
+    """Reader position in an append-only JSON Lines file, plus appends to it"""
+
+    def __init__(self, path, max_read_bytes=MAX_READ_BYTES):
+        self.path = path
+        self.max_read_bytes = max_read_bytes
+        self.offset = 0
+        self.rejected = 0
+        self._identity = None
+        self._append_lock = threading.Lock()
+
+    def read_new(self):
+        """
+        (rows, reset) for the complete lines appended since the last call.
+
+        reset is True when the file was truncated or replaced since, in
+        which case rows start again from its first line. Lines that are not
+        a JSON object are logged and skipped.
+        """
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return [], False
+
+        reset = False
+        identity = (st.st_dev, st.st_ino)
+        if identity != self._identity or st.st_size < self.offset:
+            reset = self._identity is not None
+            self._identity = identity
+            self.offset = 0
+        if st.st_size == self.offset:
+            return [], reset
+
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            chunk = f.read(self.max_read_bytes)
+            if not chunk.endswith(b"\n"):
+                chunk += f.readline()  # finish the last line if it is complete
+        end = chunk.rfind(b"\n") + 1
+        if not end:
+            return [], reset
+
+        rows = []
+        for line in chunk[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                txn = json.loads(line)
+            except ValueError:
+                txn = None
+            if not isinstance(txn, dict):
+                self.rejected += 1
+                log.warning(" Skipping invalid line in %s: %.80r", self.path, line)
+                continue
+            rows.append(txn)
+        self.offset += end
+        return rows, reset
+
+    def append(self, transactions):
+        """Append transactions as one write, so concurrent readers see whole lines"""
+        data = "".join(json.dumps(txn, separators=(",", ":")) + "\n" for txn in transactions)
+        with self._append_lock, open(self.path, "ab") as f:
+            f.write(data.encode())
+
+
+class LogTailer:
+    """Background thread applying an IngestLog to a TransactionStore"""
+
+    def __init__(self, store, ingest_log, poll_interval=INGEST_POLL_INTERVAL):
+        self.store = store
+        self.log = ingest_log
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def poll(self):
+        """Apply everything appended since the last poll; returns the row count"""
+        applied = 0
+        with self._lock:
+            while True:
+                before = self.log.offset
+                rows, reset = self.log.read_new()
+                if reset:
+                    log.warning(" %s was truncated or replaced, re-reading it", self.log.path)
+                    self.store.reset_ingested()
+                if rows:
+                    applied += self.store.ingest(rows)
+                if self.log.offset == before:
+                    return applied
+
+    def start(self):
+        if self._thread is None and self.poll_interval > 0:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._tail, name="ingest-log-tailer", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_interval + 1)
+            self._thread = None
+
+    def stats(self):
+        return {"log": self.log.path, "offset": self.log.offset, "rejected": self.log.rejected}
+
+    def _tail(self):
+        while True:
+            try:
+                self.poll()
+            except Exception as e:
+                log.error(" Ingesting %s failed: %s", self.log.path, e)
+            if self._stop.wait(self.poll_interval):
+                return
@@ -0,0 +1,281 @@
+"""
+instrumentation.py - Leveled logging and latency histograms
+
+Logging
+    get_logger(name) returns a stdlib logger whose records go through a
+    queue to a background thread that writes them to stdout, so the request
+    path never blocks on console I/O. Messages use lazy %-formatting, so a
+    disabled level costs one integer comparison.
+
+        UPI_LOG_LEVEL   DEBUG / INFO (default) / WARNING / ERROR
+        UPI_LOG_SAMPLE  fraction of DEBUG/INFO records kept (default 1.0)
+
+Metrics
+    timed("stage") times a block into a fixed-bucket histogram,
+    observe("stage", seconds) records a duration measured elsewhere and
+    observe_count(name, n) tracks counts such as graph steps per turn.
+    render_metrics() produces the Prometheus text format; the server
+    serves it on /metrics and the agent on UPI_METRICS_PORT if set.
+
+        UPI_METRICS     "0" turns all timing into no-ops (default on)
+"""
+
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter
+
+LOG_LEVEL = os.environ.get("UPI_LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE = float(os.environ.get("UPI_LOG_SAMPLE", 1.0))
+METRICS_ENABLED = os.environ.get("UPI_METRICS", "1") != "0"
+
+# Seconds; roughly x2.5 steps from 50 µs to 30 s
+LATENCY_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+COUNT_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 30, 50)
+
+
+# ==========================================
+# LOGGING
+# ==========================================
+
+class _SampleFilter(logging.Filter):
+    """Keep a random `rate` share of records below WARNING"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+_root = logging.getLogger("upi")
+_listener = None
+_logging_lock = threading.Lock()
+
+
+def _configure_logging():
+    global _listener
+    with _logging_lock:
+        if _listener is not None:
+            return
+        records = queue.SimpleQueue()
+        handler = logging.handlers.QueueHandler(records)
+        if LOG_SAMPLE < 1.0:
+            handler.addFilter(_SampleFilter(LOG_SAMPLE))
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(logging.Formatter("%(message)s"))
+        _listener = logging.handlers.QueueListener(records, output)
+        _listener.start()
+        # Drain the queue on interpreter exit
+        atexit.register(_listener.stop)
+
+        _root.setLevel(LOG_LEVEL)
+        _root.addHandler(handler)
+        _root.propagate = False
+
+
+def get_logger(name):
+    """Logger under "upi"; configured on first use"""
+    _configure_logging()
+    return _root.getChild(name)
+
+
+def flush_logs():
+    """Write out everything queued so far"""
+    with _logging_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener.start()
+
+
+# ==========================================
+# HISTOGRAMS
+# ==========================================
+
+class Histogram:
+    """Cumulative fixed-bucket histogram (Prometheus style), thread-safe"""
+
+    __slots__ = ("buckets", "counts", "count", "total", "_lock")
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        slot = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[slot] += 1
+            self.count += 1
+            self.total += value
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (None if empty)"""
+        with self._lock:
+            if not self.count:
+                return None
+            rank = q * self.count
+            seen = 0
+            for bound, n in zip(self.buckets + (float("inf"),), self.counts):
+                seen += n
+                if seen >= rank:
+                    return bound
+        return float("inf")
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "count": self.count,
+                "sum": self.total,
+                "buckets": dict(zip(self.buckets, self.counts)),
+            }
+
+
+_latencies = {}
+_counts = {}
+_metrics_lock = threading.Lock()
+
+
+def _get(registry, name, buckets):
+    histogram = registry.get(name)
+    if histogram is None:
+        with _metrics_lock:
+            histogram = registry.setdefault(name, Histogram(buckets))
+    return histogram
+
+
+def latency_histogram(stage):
+    return _get(_latencies, stage, LATENCY_BUCKETS)
+
+
+def count_histogram(name):
+    return _get(_counts, name, COUNT_BUCKETS)
+
+
+def observe(stage, seconds):
+    if METRICS_ENABLED:
+        latency_histogram(stage).observe(seconds)
+
+
+def observe_count(name, value):
+    if METRICS_ENABLED:
+        count_histogram(name).observe(value)
+
+
+class _Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(perf_counter() - self.start)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timed(stage):
+    """Context manager recording the block's wall time under `stage`"""
+    if not METRICS_ENABLED:
+        return _NULL_TIMER
+    return _Timer(latency_histogram(stage))
+
+
+# ==========================================
+# EXPORT
+# ==========================================
+
+def metrics_snapshot():
+    """{"latency": {stage: {...}}, "counts": {name: {...}}} for JSON/reports"""
+    return {
+        "latency": {name: h.snapshot() for name, h in sorted(_latencies.items())},
+        "counts": {name: h.snapshot() for name, h in sorted(_counts.items())},
+    }
+
+
+def _render_family(lines, family, label, registry):
+    lines.append(f"# TYPE {family} histogram")
+    for name, histogram in sorted(registry.items()):
+        snap = histogram.snapshot()
+        cumulative = 0
+        for bound, n in snap["buckets"].items():
+            cumulative += n
+            lines.append(f'{family}_bucket{{{label}="{name}",le="{bound:g}"}} {cumulative}')
+        lines.append(f'{family}_bucket{{{label}="{name}",le="+Inf"}} {snap["count"]}')
+        lines.append(f'{family}_sum{{{label}="{name}"}} {snap["sum"]:.6f}')
+        lines.append(f'{family}_count{{{label}="{name}"}} {snap["count"]}')
+
+
+def render_metrics():
+    """All histograms in the Prometheus text exposition format"""
+    lines = []
+    _render_family(lines, "upi_stage_latency_seconds", "stage", _latencies)
+    _render_family(lines, "upi_count", "name", _counts)
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = render_metrics().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_metrics_server = None
+
+
+def serve_metrics(port=None):
+    """
+    Serve /metrics from a daemon thread, once per process.
+
+    `port` defaults to UPI_METRICS_PORT; without either nothing is started.
+    """
+    global _metrics_server
+    port = port or os.environ.get("UPI_METRICS_PORT")
+    with _metrics_lock:
+        if _metrics_server is not None or not port:
+            return _metrics_server
+        _metrics_server = ThreadingHTTPServer(("127.0.0.1", int(port)), _MetricsHandler)
+    threading.Thread(
+        target=_metrics_server.serve_forever, name="metrics", daemon=True
+    ).start()
+    get_logger("metrics").info(" Metrics: http://127.0.0.1:%s/metrics", port)
+    return _metrics_server
@@ -0,0 +1,319 @@
+"""
+load_test.py - End-to-end load test of the payment agent
+
+Generates a dataset with create_db.py, starts server.py on it and a
+scripted OpenAI-compatible LLM (stub_llm.py), then runs N conversations,
+`--concurrency` at a time, through run_upi_agent (or arun_upi_agent with
+--mode async). Every conversation is the usual three turns:
+
+    "Hi, money was debited but the payment failed"
+    "It was on 2024-12-23 at 18:18:05 for ₹2941.80"
+    "5907"                                (answering the last-4 question)
+
+A share of them use the wrong last 4 digits (fuzzy match) or a date with
+no data (miss). Reports p50/p95/p99 turn latency, LLM and MCP calls per
+turn and throughput; --max-p95 makes it a regression gate (exit code 1).
+
+    python -m upi_agent.load_test --conversations 200 --concurrency 20 --llm-latency 0.2
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+GREETING = "Hi, money was debited from my account but the UPI payment failed"
+
+
+# ==========================================
+# SETUP
+# ==========================================
+
+def generate_dataset(path, rows, days, seed):
+    """transactions.jsonl with `rows` rows, written by create_db.py"""
+    subprocess.run(
+        [sys.executable, os.path.join(BASE_DIR, "create_db.py"), "--format", "jsonl",
+         "--count", str(rows), "--days", str(days), "--seed", str(seed), "--output", path],
+        check=True, stdout=subprocess.DEVNULL,
+    )
+
+
+def sample_transactions(path, count, seed):
+    """`count` rows picked uniformly from a JSON Lines file in one pass"""
+    rng = random.Random(seed)
+    sample = []
+    with open(path) as f:
+        for seen, line in enumerate(f):
+            if len(sample) < count:
+                sample.append(line)
+            else:
+                slot = rng.randrange(seen + 1)
+                if slot < count:
+                    sample[slot] = line
+    return [json.loads(line) for line in sample]
+
+
+def start_server(data_path, port, log_path):
+    """server.py on `data_path`; returns the process once the data is loaded"""
+    env = dict(os.environ, UPI_TRANSACTIONS_PATH=data_path, UPI_MCP_PORT=str(port),
+               UPI_LOG_LEVEL=os.environ.get("UPI_LOG_LEVEL", "WARNING"))
+    log = open(log_path, "w")
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(BASE_DIR, "server.py")],
+        cwd=BASE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    stats_url = f"http://127.0.0.1:{port}/stats"
+    deadline = time.monotonic() + 300
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server.py exited early, see {log_path}")
+        try:
+            with urllib.request.urlopen(stats_url, timeout=5) as response:
+                if json.load(response)["store"]["count"]:
+                    return process
+        except OSError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"server.py did not come up, see {log_path}")
+
+
+def build_script(txn, kind):
+    """The three user messages of one conversation"""
+    date, last4 = txn["date"], txn["sender_last4"]
+    if kind == "fuzzy":
+        last4 = f"{(int(last4) + 1) % 10000:04d}"
+    elif kind == "miss":
+        date = "2001-01-01"
+    return [
+        GREETING,
+        f"It was on {date} at {txn['time']} for ₹{txn['amount']:.2f}",
+        last4,
+    ]
+
+
+def build_conversations(transactions, fuzzy_rate, miss_rate, seed):
+    rng = random.Random(seed)
+    conversations = []
+    for txn in transactions:
+        roll = rng.random()
+        kind = "fuzzy" if roll < fuzzy_rate else "miss" if roll < fuzzy_rate + miss_rate else "exact"
+        conversations.append((kind, build_script(txn, kind)))
+    return conversations
+
+
+# ==========================================
+# DRIVERS
+# ==========================================
+
+def run_conversation(script, llm, run_upi_agent):
+    """[(latency, reply or None, error or None)] for each turn"""
+    upi_state = {}
+    turns = []
+    for message in script:
+        started = time.perf_counter()
+        try:
+            reply, upi_state = run_upi_agent(message, llm, upi_state)
+            turns.append((time.perf_counter() - started, reply, None))
+        except Exception as e:
+            turns.append((time.perf_counter() - started, None, repr(e)))
+    return turns
+
+
+async def arun_conversation(script, llm, arun_upi_agent):
+    upi_state = {}
+    turns = []
+    for message in script:
+        started = time.perf_counter()
+        try:
+            reply, upi_state = await arun_upi_agent(message, llm, upi_state)
+            turns.append((time.perf_counter() - started, reply, None))
+        except Exception as e:
+            turns.append((time.perf_counter() - started, None, repr(e)))
+    return turns
+
+
+def drive_threads(scripts, llm, concurrency):
+    from upi_agent.main_agents import run_upi_agent
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(lambda script: run_conversation(script, llm, run_upi_agent), scripts))
+
+
+def drive_async(scripts, llm, concurrency):
+    from upi_agent.main_agents import arun_upi_agent
+
+    async def main():
+        gate = asyncio.Semaphore(concurrency)
+
+        async def one(script):
+            async with gate:
+                return await arun_conversation(script, llm, arun_upi_agent)
+
+        return await asyncio.gather(*(one(script) for script in scripts))
+
+    return asyncio.run(main())
+
+
+# ==========================================
+# REPORT
+# ==========================================
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * q // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def outcome(reply):
+    if reply is None:
+        return "error"
+    if "couldn't find any transactions" in reply:
+        return "not_found"
+    if "don't match" in reply:
+        return "fuzzy"
+    if "Transaction ID:" in reply:
+        return "found"
+    return "other"
+
+
+def summarize(results, conversations, elapsed, llm_calls, mcp_calls):
+    latencies = sorted(latency for turns in results for latency, _, _ in turns)
+    turn_count = len(latencies)
+    errors = [error for turns in results for _, _, error in turns if error]
+    outcomes = {}
+    for (kind, _), turns in zip(conversations, results):
+        key = f"{kind}->{outcome(turns[-1][1])}"
+        outcomes[key] = outcomes.get(key, 0) + 1
+    return {
+        "conversations": len(results),
+        "turns": turn_count,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "elapsed_s": round(elapsed, 3),
+        "turns_per_s": round(turn_count / elapsed, 2) if elapsed else None,
+        "latency_s": {
+            "mean": round(sum(latencies) / turn_count, 4) if turn_count else None,
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": latencies[-1] if latencies else None,
+        },
+        "llm_calls_per_turn": round(llm_calls / turn_count, 3) if turn_count else None,
+        "mcp_calls_per_turn": round(mcp_calls / turn_count, 3) if mcp_calls is not None and turn_count else None,
+        "outcomes": outcomes,
+    }
+
+
+def print_report(report):
+    latency = report["latency_s"]
+    print("=" * 60)
+    print(" LOAD TEST")
+    print("=" * 60)
+    print(f" Conversations: {report['conversations']}  turns: {report['turns']}  "
+          f"errors: {report['errors']}")
+    print(f" Throughput: {report['turns_per_s']} turns/s over {report['elapsed_s']} s")
+    print(" Turn latency (ms): " + "  ".join(
+        f"{name} {value * 1000:.1f}" for name, value in latency.items() if value is not None
+    ))
+    print(f" LLM calls / turn: {report['llm_calls_per_turn']}")
+    print(f" MCP calls / turn: {report['mcp_calls_per_turn']}")
+    print(f" Outcomes: {report['outcomes']}")
+    if report["first_error"]:
+        print(f" First error: {report['first_error']}")
+
+
+def _mcp_call_total():
+    from upi_agent.instrumentation import metrics_snapshot
+    counts = metrics_snapshot()["counts"].get("agent.mcp_calls")
+    return counts["sum"] if counts else None
+
+
+# ==========================================
+# MAIN
+# ==========================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end load test of the payment agent")
+    parser.add_argument("--rows", type=int, default=10000, help="transactions in the generated dataset")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--conversations", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--mode", choices=["thread", "async"], default="thread",
+                        help="run_upi_agent on a thread pool, or arun_upi_agent on one event loop")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="stub LLM delay in seconds")
+    parser.add_argument("--llm-jitter", type=float, default=0.0)
+    parser.add_argument("--fuzzy-rate", type=float, default=0.1, help="share with wrong last 4 digits")
+    parser.add_argument("--miss-rate", type=float, default=0.1, help="share with no matching data")
+    parser.add_argument("--port", type=int, default=8765, help="port for the MCP server under test")
+    parser.add_argument("--json", default=None, help="also write the report to this file")
+    parser.add_argument("--max-p95", type=float, default=None,
+                        help="fail (exit 1) if p95 turn latency exceeds this many seconds")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="upi_load_")
+    data_path = os.path.join(workdir, "transactions.jsonl")
+    print(f" Generating {args.rows} transactions in {workdir}")
+    generate_dataset(data_path, args.rows, args.days, args.seed)
+    conversations = build_conversations(
+        sample_transactions(data_path, args.conversations, args.seed),
+        args.fuzzy_rate, args.miss_rate, args.seed,
+    )
+
+    server = start_server(data_path, args.port, os.path.join(workdir, "server.log"))
+    try:
+        # Read by the agent modules at import time
+        os.environ["UPI_MCP_URL"] = f"http://127.0.0.1:{args.port}/mcp"
+        os.environ.setdefault("UPI_CONVERSATIONS_DB", os.path.join(workdir, "conversations.db"))
+        os.environ.setdefault("UPI_LOG_LEVEL", "WARNING")
+
+        from langchain_openai import ChatOpenAI
+        from upi_agent.stub_llm import start_stub_llm
+
+        stub = start_stub_llm(latency=args.llm_latency, jitter=args.llm_jitter)
+        llm = ChatOpenAI(model="stub", base_url=stub.base_url, api_key="stub",
+                         temperature=0.1, max_retries=0)
+        drive = drive_async if args.mode == "async" else drive_threads
+
+        # Builds the agent and opens the MCP session outside the measurement
+        drive([[GREETING]], llm, 1)
+        llm_before, mcp_before = stub.requests, _mcp_call_total()
+
+        print(f" Running {len(conversations)} conversations, {args.concurrency} at a time ({args.mode})")
+        started = time.perf_counter()
+        results = drive([script for _, script in conversations], llm, args.concurrency)
+        elapsed = time.perf_counter() - started
+
+        mcp_after = _mcp_call_total()
+        mcp_calls = mcp_after - (mcp_before or 0) if mcp_after is not None else None
+        report = summarize(results, conversations, elapsed, stub.requests - llm_before, mcp_calls)
+        report["config"] = vars(args)
+    finally:
+        server.terminate()
+        server.wait()
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f" Report saved to {args.json}")
+
+    if args.max_p95 is not None and (report["latency_s"]["p95"] or 0) > args.max_p95:
+        print(f" FAIL: p95 {report['latency_s']['p95']:.3f}s > {args.max_p95}s")
+        return 1
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
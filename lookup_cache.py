@@ -0,0 +1,175 @@
+"""
+lookup_cache.py - Client-side cache for get_transaction_details results
+
+Shared by every session in the process and keyed on the normalized
+(date, time, amount, sender_last4) tuple plus the search options, so
+"6:18 pm" / "18:18" and 2941.8 / 2941.80 land on the same entry.
+
+Entries expire after `ttl` seconds and the least recently used ones are
+evicted past `max_entries`. Every entry carries the server's
+dataset_version for its date. As soon as a response, or a
+get_store_version(date) check before serving a hit, shows a different
+version for that date, that date's entries are dropped. The check runs at
+most once per date every `version_check_interval` seconds. Rows the server
+ingests for one date therefore leave the other dates' entries alone.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+LOOKUP_CACHE_TTL = float(os.environ.get("UPI_LOOKUP_CACHE_TTL", 300))
+LOOKUP_CACHE_SIZE = int(os.environ.get("UPI_LOOKUP_CACHE_SIZE", 1024))
+VERSION_CHECK_INTERVAL = float(os.environ.get("UPI_LOOKUP_VERSION_CHECK", 5))
+
+
+def _normalize_time(value):
+    if not value:
+        return None
+    value = str(value).strip()
+    if len(value) == 5:
+        value += ":00"
+    return value
+
+
+def _normalize_amount(value):
+    try:
+        return round(float(value), 2)
+    except (TypeError, ValueError):
+        return None
+
+
+def lookup_scope(key):
+    """Date whose dataset_version a lookup key depends on (None: all dates)"""
+    return key[0]
+
+
+def lookup_key(tool_input):
+    """Hashable cache key for get_transaction_details arguments, or None"""
+    if not isinstance(tool_input, dict):
+        return None
+    try:
+        last_n = int(tool_input.get("last_n", 10))
+    except (TypeError, ValueError):
+        return None
+    return (
+        str(tool_input.get("date") or "").strip() or None,
+        _normalize_time(tool_input.get("time")),
+        _normalize_amount(tool_input.get("amount")),
+        str(tool_input.get("sender_last4") or "").strip() or None,
+        last_n,
+        bool(tool_input.get("fuzzy_search", True)),
+        bool(tool_input.get("ranked", False)),
+    )
+
+
+class LookupCache:
+    """TTL + LRU map of lookup key -> raw tool response, tagged by per-date dataset version"""
+
+    def __init__(self, ttl=LOOKUP_CACHE_TTL, max_entries=LOOKUP_CACHE_SIZE,
+                 version_check_interval=VERSION_CHECK_INTERVAL):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.version_check_interval = version_check_interval
+        self._versions = {}     # date -> current dataset_version
+        self._checked_at = {}   # date -> monotonic time of the last check
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[0] > time.monotonic()
+
+    def get(self, key):
+        """Cached response, or None (counted as a miss)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._entries[key]
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, response, version):
+        """Store a response; responses without a dataset version are not cached"""
+        if key is None or version is None:
+            return
+        scope = lookup_scope(key)
+        self.observe_version(version, scope)
+        with self._lock:
+            if version != self._versions.get(scope):
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def version_check_due(self, scope=None):
+        """Whether hits for this date need a get_store_version check first"""
+        checked_at = self._checked_at.get(scope, 0.0)
+        return time.monotonic() - checked_at >= self.version_check_interval
+
+    def observe_version(self, version, scope=None, checked=False):
+        """Record the server's current dataset version for a date, dropping older entries"""
+        if version is None:
+            return
+        with self._lock:
+            if checked:
+                self._checked_at[scope] = time.monotonic()
+            if version == self._versions.get(scope):
+                return
+            stale = [key for key in self._entries if lookup_scope(key) == scope]
+            for key in stale:
+                del self._entries[key]
+            if stale:
+                self.invalidations += 1
+            self._versions[scope] = version
+            if len(self._versions) > self.max_entries:
+                # Forget dates without entries, so this stays bounded too
+                live = {lookup_scope(key) for key in self._entries}
+                self._versions = {k: v for k, v in self._versions.items() if k in live}
+                self._checked_at = {k: v for k, v in self._checked_at.items() if k in live}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "dates": len(self._versions),
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_lookup_cache():
+    """Process-wide LookupCache shared by all sessions"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LookupCache()
+        return _cache
@@ -1,26 +1,26 @@
 
+import os
+
 import colorama
 from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage
 
-from upi_agent.main_agents import get_payment_agent
+from upi_agent.main_agents import run_upi_agent
 
 colorama.init(autoreset=True)
 
+# UPI_LLM_URL points the chat at another endpoint, e.g. stub_llm.py
 llm = ChatOpenAI(
-    model="NPCI_Greviance",
-    base_url="http://183.82.7.228:9519/v1",
-    api_key="sk-api",
+    model=os.environ.get("UPI_LLM_MODEL", "NPCI_Greviance"),
+    base_url=os.environ.get("UPI_LLM_URL", "http://183.82.7.228:9519/v1"),
+    api_key=os.environ.get("UPI_LLM_API_KEY", "sk-api"),
     temperature=0.1,
 )
 
-agent = get_payment_agent(llm)
-
-
 print(colorama.Fore.CYAN + " PAYMENT AGENT CHAT")
 
 
-messages = []
+# Only the thread id lives here; the conversation is checkpointed
+upi_state = {}
 
 while True:
     user_input = input(colorama.Fore.WHITE + "User: ")
@@ -32,19 +32,10 @@ while True:
     if not user_input.strip():
         continue
     
-    # Add user message
-    messages.append(HumanMessage(content=user_input))
-    
     try:
-        # Invoke agent
-        resp = agent.invoke({'messages': messages})
-        
-        # Get AI response
-        ai_response = resp['messages'][-1].content
+        # Invoke agent with just the new message
+        ai_response, upi_state = run_upi_agent(user_input, llm, upi_state)
         print(colorama.Fore.GREEN + f"AI: {ai_response}\n")
         
-        # Update messages with full conversation
-        messages = resp['messages']
-        
     except Exception as e:
         print(colorama.Fore.RED + f" Error: {str(e)}\n")
\ No newline at end of file
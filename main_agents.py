@@ -1,77 +1,211 @@
 import asyncio
+import contextvars
 import json
+import os
+import threading
 import uuid
+from time import perf_counter
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_openai import ChatOpenAI
 from langgraph.constants import START, END
 from langgraph.graph import StateGraph
-from langchain_core.messages import ToolMessage, AIMessage
-from pydantic import BaseModel
-from typing import Any
+from langgraph.graph.message import add_messages
+from langchain_core.messages import ToolMessage, AIMessage, SystemMessage
+from pydantic import BaseModel, field_validator
+from typing import Annotated, Any
 import datetime
-from upi_agent.prompts import SYSTEM_PROMPT_TEMPLATE, HUMAN_PROMPT_TEMPLATE
+from upi_agent.conversations import get_conversation_store
+from upi_agent.instrumentation import get_logger, observe, observe_count, serve_metrics, timed
+from upi_agent.history import render_history, tool_result_payload
+from upi_agent.renderer import ANSWER, render_transaction_result
+from upi_agent.prompts import (
+    SYSTEM_PROMPT_TEMPLATE,
+    HUMAN_PROMPT_TEMPLATE,
+    STATIC_SYSTEM_PROMPT,
+    CONTEXT_PROMPT_TEMPLATE,
+)
 from upi_agent.schemas import AgentDecision
-from upi_agent.mcp_tools import load_mcp_tools
+from upi_agent.slots import SLOT_NAMES, expected_slot, extract_slots
+from upi_agent.mcp_tools import get_mcp_session, tool_payload
+from upi_agent.lookup_cache import get_lookup_cache, lookup_key, lookup_scope
 from upi_agent.tools import output, error_handler
 from upi_agent.enums import Tool  
 
+# "prefix_cache": static system block first, date + history last
+# "inline": the original template with the date at the very top
+PROMPT_LAYOUT = os.environ.get("UPI_PROMPT_LAYOUT", "prefix_cache")
 
-def get_payment_agent(llm: ChatOpenAI):
+log = get_logger("agent")
+
+# Per-turn counters (graph_steps, llm_calls, mcp_calls) of the running turn
+_turn_counts = contextvars.ContextVar("upi_turn_counts", default=None)
+
+
+def _count(name):
+    counts = _turn_counts.get()
+    if counts is not None:
+        counts[name] += 1
+
+
+def _instrumented(name, node):
+    """Graph node that counts as a step and is timed under agent.node.<name>"""
+    stage = f"agent.node.{name}"
+    if asyncio.iscoroutinefunction(node):
+        async def run(state):
+            _count("graph_steps")
+            with timed(stage):
+                return await node(state)
+    else:
+        def run(state):
+            _count("graph_steps")
+            with timed(stage):
+                return node(state)
+    run.__name__ = node.__name__
+    return run
+
+
+def build_prompt(layout: str = PROMPT_LAYOUT):
+    """Decision prompt; the prefix_cache system message is rendered once, here"""
+    if layout == "inline":
+        return ChatPromptTemplate.from_messages([
+            ('system', SYSTEM_PROMPT_TEMPLATE),
+            ('human', HUMAN_PROMPT_TEMPLATE),
+        ])
+    if layout == "prefix_cache":
+        return ChatPromptTemplate.from_messages([
+            SystemMessage(STATIC_SYSTEM_PROMPT),
+            ('human', CONTEXT_PROMPT_TEMPLATE),
+        ])
+    raise ValueError(f"Unknown prompt layout: {layout}")
+
+
+def get_payment_agent(llm: ChatOpenAI, use_async: bool = False, checkpointer=None):
+    """
+    Compile the payment agent graph.
+
+    With use_async=True the LLM and MCP nodes are coroutines (llm.ainvoke,
+    MCP acall); run that graph with `await agent.ainvoke(...)`, e.g. via
+    arun_upi_agent, so many chats can share one event loop.
+
+    With a checkpointer, state is kept per thread id: invoke with
+    {"messages": [new_message]} and {"configurable": {"thread_id": ...}}.
+    Nodes return only what they change; messages are appended by the
+    add_messages reducer.
+    """
     class AgentState(BaseModel):
-        messages: list[Any]
-        last_decision: Any = None
+        messages: Annotated[list[Any], add_messages]
+        # AgentDecision.model_dump(): checkpoints hold only plain types
+        last_decision: dict | None = None
         date: str | None = None
         time: str | None = None
         amount: float | None = None
         sender_last4: str | None = None
+        # slots the user gave since the last get_transaction_details call
+        fresh_slots: list[str] = []
 
         has_transaction_details: bool = False
-    mcp_tools = load_mcp_tools()
+
+        @field_validator('last_decision', mode='before')
+        @classmethod
+        def _plain_decision(cls, value):
+            # checkpoints written before decisions were stored as dicts
+            return value.model_dump() if isinstance(value, BaseModel) else value
+
+    # One MCP session per process, reused by every tool call
+    mcp_session = get_mcp_session()
+    mcp_tools = mcp_session.tools()
+    # Results shared across sessions, dropped per date when the server's data changes
+    lookup_cache = get_lookup_cache()
     all_tools = [output, error_handler] + list(mcp_tools.values())
 
-    prompt = ChatPromptTemplate.from_messages([
-        ('system', SYSTEM_PROMPT_TEMPLATE),
-        ('human', HUMAN_PROMPT_TEMPLATE),
-    ])
+    prompt = build_prompt()
     llm_with_structure = llm.with_structured_output(AgentDecision)
     llm_chain = prompt | llm_with_structure
 
-    def tool(state: AgentState):
-        """Main LLM decision node"""
+    def llm_input(state: AgentState):
+        """Prompt variables for the decision LLM"""
         last_msg = state.messages[-1]
         if hasattr(last_msg, 'content'):
             user_input = last_msg.content
         else:
             user_input = str(last_msg)
         
-        chat_history = []
-        for m in state.messages[:-1]:
-            if hasattr(m, 'content'):
-                chat_history.append(m.content)
-            else:
-                chat_history.append(str(m))
+        # Slots, recent turns and tool summaries within a token budget
+        chat_history = render_history(state.messages[:-1], {
+            'date': state.date,
+            'time': state.time,
+            'amount': state.amount,
+            'sender_last4': state.sender_last4,
+        })
         
-        ai_message = llm_chain.invoke({
+        return {
             'user_input': user_input,
             'chat_history': chat_history,
-            'available_tools': list(mcp_tools.keys()),
-            'current_date': str(datetime.datetime.now())
-        })
-        
-        state.last_decision = ai_message
-        return state
+            # as last discovered: never opens the session, so the async
+            # node cannot block the event loop on a reconnect
+            'available_tools': list(mcp_session.cached_tools().keys()),
+            # day granularity: the prompt only changes once a day
+            'current_date': datetime.date.today().isoformat()
+        }
+
+    def extract_slots_node(state: AgentState):
+        """Rule-based date/time/amount/last4 extraction before the LLM"""
+        last_msg = state.messages[-1]
+        if getattr(last_msg, 'type', None) != 'human':
+            return {'last_decision': None}
+
+        previous = state.messages[-2] if len(state.messages) > 1 else None
+        question = previous.content if getattr(previous, 'type', None) == 'ai' else None
+        found = extract_slots(last_msg.content, expected_slot(question))
+        if not found:
+            return {'last_decision': None}
+
+        fresh = sorted(set(state.fresh_slots) | set(found))
+        update = {**found, 'fresh_slots': fresh, 'last_decision': None}
+        if set(fresh) == set(SLOT_NAMES):
+            # All four given since the last search: no LLM step needed to call the tool
+            slots = {name: found.get(name, getattr(state, name)) for name in SLOT_NAMES}
+            log.info("Slots complete: %s", slots)
+            update['last_decision'] = AgentDecision(
+                thought="All four transaction details were extracted from the user's messages.",
+                action='get_transaction_details',
+                action_input={**slots, 'last_n': 10},
+            ).model_dump()
+        return update
+
+    def slot_router(state: AgentState):
+        """Straight to the tool when extraction produced a decision"""
+        return 'tool_call' if state.last_decision is not None else 'process_input'
+
+    def tool(state: AgentState):
+        """Main LLM decision node"""
+        prompt_input = llm_input(state)
+        _count("llm_calls")
+        with timed("agent.llm"):
+            return {'last_decision': llm_chain.invoke(prompt_input).model_dump()}
+
+    async def atool(state: AgentState):
+        """Main LLM decision node (async)"""
+        prompt_input = llm_input(state)
+        _count("llm_calls")
+        with timed("agent.llm"):
+            return {'last_decision': (await llm_chain.ainvoke(prompt_input)).model_dump()}
+
+    def decision(state: AgentState):
+        """The last decision, rebuilt from its checkpointed dict"""
+        return AgentDecision.model_validate(state.last_decision)
 
     def router(state: AgentState):
         """Route to appropriate node based on action"""
-        action = state.last_decision.action
+        action = decision(state).action
         # Convert to string for routing
         if isinstance(action, str):
             return action
         return str(action)  # Handle both string and enum
 
-    def tool_call_node(state: AgentState):
-        """Execute tool calls"""
-        last_decision = state.last_decision
+    def pending_tool_call(state: AgentState, verbose: bool = True):
+        """(tool_name, tool_input) of the last decision"""
+        last_decision = decision(state)
         tool_name = last_decision.action
         
         # Convert to string if it's an enum or has .value
@@ -80,41 +214,169 @@ def get_payment_agent(llm: ChatOpenAI):
         elif not isinstance(tool_name, str):
             tool_name = str(tool_name)
         
-        print(f"Executing tool: {tool_name}")
-        print(f"Tool input: {last_decision.action_input}")
+        if verbose:
+            log.info("Executing tool: %s", tool_name)
+            log.debug("Tool input: %s", last_decision.action_input)
+
+        # Parse action_input if it's a string
+        if isinstance(last_decision.action_input, str):
+            tool_input = json.loads(last_decision.action_input)
+        else:
+            tool_input = last_decision.action_input
+        return tool_name, tool_input
 
+    def slot_updates(tool_input):
+        """AgentState slots taken from get_transaction_details arguments"""
+        slots = {}
+        for name in ('date', 'time', 'sender_last4'):
+            if tool_input.get(name):
+                slots[name] = str(tool_input[name])
         try:
-            # Parse action_input if it's a string
-            if isinstance(last_decision.action_input, str):
-                tool_input = json.loads(last_decision.action_input)
-            else:
-                tool_input = last_decision.action_input
+            slots['amount'] = float(tool_input['amount'])
+        except (KeyError, TypeError, ValueError):
+            pass
+        return slots
+
+    def record_tool_response(tool_resp, tool_input=None):
+        log.debug("Tool response: %s", tool_resp)
+        # Keep the decoded payload so history can summarise it without re-parsing
+        payload = tool_payload(tool_resp)
+        content = json.dumps(payload, ensure_ascii=False) if payload is not None else str(tool_resp)
+        update = {'messages': [ToolMessage(content, tool_call_id=str(uuid.uuid4()), artifact=payload)]}
+        if tool_input is not None:
+            update.update(slot_updates(tool_input))
+            update['fresh_slots'] = []
+        return update
+
+    def response_version(tool_resp):
+        return (tool_payload(tool_resp) or {}).get('dataset_version')
+
+    def lookup_transaction(tool_input):
+        """get_transaction_details through the shared lookup cache"""
+        key = lookup_key(tool_input)
+        scope = lookup_scope(key) if key is not None else None
+        if key in lookup_cache and lookup_cache.version_check_due(scope):
+            try:
+                _count("mcp_calls")
+                version = response_version(mcp_session.call('get_store_version', {'date': scope}))
+                lookup_cache.observe_version(version, scope, checked=True)
+            except Exception as e:
+                log.warning("Store version check failed: %s", e)
+        cached = lookup_cache.get(key) if key is not None else None
+        if cached is not None:
+            return cached
+        # Runs on the shared MCP session's event loop
+        _count("mcp_calls")
+        with timed("agent.mcp.get_transaction_details"):
+            tool_resp = mcp_session.call('get_transaction_details', tool_input)
+        lookup_cache.put(key, tool_resp, response_version(tool_resp))
+        return tool_resp
+
+    async def alookup_transaction(tool_input):
+        """lookup_transaction for the async graph"""
+        key = lookup_key(tool_input)
+        scope = lookup_scope(key) if key is not None else None
+        if key in lookup_cache and lookup_cache.version_check_due(scope):
+            try:
+                _count("mcp_calls")
+                version = response_version(await mcp_session.acall('get_store_version', {'date': scope}))
+                lookup_cache.observe_version(version, scope, checked=True)
+            except Exception as e:
+                log.warning("Store version check failed: %s", e)
+        cached = lookup_cache.get(key) if key is not None else None
+        if cached is not None:
+            return cached
+        _count("mcp_calls")
+        with timed("agent.mcp.get_transaction_details"):
+            tool_resp = await mcp_session.acall('get_transaction_details', tool_input)
+        lookup_cache.put(key, tool_resp, response_version(tool_resp))
+        return tool_resp
+
+    def record_tool_error(e: Exception):
+        log.warning("Tool error: %s", e)
+        error_msg = {"error": f"Tool execution failed: {str(e)}"}
+        return {'messages': [ToolMessage(str(error_msg), tool_call_id=str(uuid.uuid4()))]}
+
+    def tool_call_node(state: AgentState):
+        """Execute tool calls"""
+        try:
+            tool_name, tool_input = pending_tool_call(state)
             
             # Execute the appropriate tool
             if tool_name == 'error_handler':
                 tool_resp = error_handler.invoke(tool_input)
             elif tool_name == 'get_transaction_details':
-                # Handle MCP tool asynchronously
-                tool_resp = asyncio.run(mcp_tools['get_transaction_details'].ainvoke(tool_input))
-            
-                
-            
+                tool_resp = lookup_transaction(tool_input)
+                return record_tool_response(tool_resp, tool_input)
             else:
                 tool_resp = {"error": f"Unknown tool: {tool_name}"}
             
-            print(f"Tool response: {tool_resp}")
-            state.messages.append(ToolMessage(str(tool_resp), tool_call_id=str(uuid.uuid4())))
+            return record_tool_response(tool_resp)
             
         except Exception as e:
-            print(f"Tool error: {str(e)}")
-            error_msg = {"error": f"Tool execution failed: {str(e)}"}
-            state.messages.append(ToolMessage(str(error_msg), tool_call_id=str(uuid.uuid4())))
-        
-        return state
+            return record_tool_error(e)
+
+    async def atool_call_node(state: AgentState):
+        """Execute tool calls (async)"""
+        try:
+            tool_name, tool_input = pending_tool_call(state)
+
+            if tool_name == 'error_handler':
+                tool_resp = await error_handler.ainvoke(tool_input)
+            elif tool_name == 'get_transaction_details':
+                tool_resp = await alookup_transaction(tool_input)
+                return record_tool_response(tool_resp, tool_input)
+            else:
+                tool_resp = {"error": f"Unknown tool: {tool_name}"}
+
+            return record_tool_response(tool_resp)
+
+        except Exception as e:
+            return record_tool_error(e)
+
+    def render_result_node(state: AgentState):
+        """Answer common get_transaction_details outcomes from templates"""
+        last_msg = state.messages[-1]
+        if getattr(last_msg, 'type', None) != 'tool':
+            return {'last_decision': None}
+        try:
+            tool_name, tool_input = pending_tool_call(state, verbose=False)
+        except ValueError:
+            return {'last_decision': None}
+        if tool_name != 'get_transaction_details':
+            return {'last_decision': None}
+
+        rendered = render_transaction_result(tool_result_payload(last_msg), tool_input, {
+            name: getattr(state, name) for name in SLOT_NAMES
+        })
+        if rendered is None:
+            # Several matches, errors, ...: the LLM decides
+            return {'last_decision': None}
+
+        kind, value = rendered
+        if kind == ANSWER:
+            rendered_decision = AgentDecision(
+                thought="Rendered the tool result from a template.",
+                action='output',
+                action_input={'message': value},
+            )
+        else:
+            rendered_decision = AgentDecision(
+                thought="No match; searching again without the time.",
+                action='get_transaction_details',
+                action_input=value,
+            )
+        return {'last_decision': rendered_decision.model_dump()}
+
+    def render_router(state: AgentState):
+        """Templated answer -> output, broader retry -> tool_call, else the LLM"""
+        if state.last_decision is None:
+            return 'process_input'
+        return router(state)
 
     def output_node(state: AgentState):
         """Output final message to user"""
-        last_decision = state.last_decision
+        last_decision = decision(state)
         message_content = last_decision.action_input
         
         # Handle both dict and string formats
@@ -125,60 +387,171 @@ def get_payment_agent(llm: ChatOpenAI):
         else:
             message_text = str(message_content)
         
-        state.messages.append(AIMessage(message_text))
-        return state
+        return {'messages': [AIMessage(message_text)]}
 
     # Build the graph
     state_graph = StateGraph(AgentState)
-    state_graph.add_node('process_input', tool)
-    state_graph.add_node('output', output_node)
-    state_graph.add_node('tool_call', tool_call_node)
+    nodes = {
+        'extract_slots': extract_slots_node,
+        'process_input': atool if use_async else tool,
+        'output': output_node,
+        'tool_call': atool_call_node if use_async else tool_call_node,
+        'render_result': render_result_node,
+    }
+    for name, node in nodes.items():
+        state_graph.add_node(name, _instrumented(name, node))
 
-    state_graph.add_edge(START, 'process_input')
+    state_graph.add_edge(START, 'extract_slots')
+    state_graph.add_conditional_edges('extract_slots', slot_router, {
+        'tool_call': 'tool_call',
+        'process_input': 'process_input',
+    })
     state_graph.add_conditional_edges('process_input', router, {
         'get_transaction_details': 'tool_call',
         'error_handler': 'tool_call',
         'output': 'output'
     })
-    state_graph.add_edge('tool_call', 'process_input')
+    state_graph.add_edge('tool_call', 'render_result')
+    state_graph.add_conditional_edges('render_result', render_router, {
+        'get_transaction_details': 'tool_call',
+        'output': 'output',
+        'process_input': 'process_input',
+    })
     state_graph.add_edge('output', END)
 
-    agent = state_graph.compile()
+    agent = state_graph.compile(checkpointer=checkpointer)
     return agent
 
 
 
 
 from langchain_core.messages import HumanMessage
-from upi_agent.main_agents import get_payment_agent
+
+
+# ==========================================
+# SHARED AGENT FACTORY
+# ==========================================
+
+_agents = {}
+_agents_lock = threading.Lock()
+
+
+_LLM_CONFIG_ATTRS = ("openai_api_base", "temperature", "max_tokens", "top_p", "seed")
+
+
+def _llm_config_key(llm):
+    """Hashable description of an LLM's configuration"""
+    try:
+        params = dict(llm._identifying_params)
+    except AttributeError:
+        return (type(llm).__name__, id(llm))
+    for attr in _LLM_CONFIG_ATTRS:
+        params.setdefault(attr, getattr(llm, attr, None))
+    return (type(llm).__name__,) + tuple(sorted((k, repr(v)) for k, v in params.items()))
+
+
+def get_shared_payment_agent(llm, use_async: bool = False):
+    """
+    Process-wide compiled agent for this LLM configuration.
+
+    The graph, prompt and structured-output chain are built once per
+    (LLM config, sync/async) and shared by every session; tool discovery is
+    cached on the MCP session. Conversation state lives in the process-wide
+    ConversationStore, keyed by thread id.
+    """
+    key = (_llm_config_key(llm), use_async)
+    agent = _agents.get(key)
+    if agent is None:
+        with _agents_lock:
+            agent = _agents.get(key)
+            if agent is None:
+                # Per-stage histograms on /metrics when UPI_METRICS_PORT is set
+                serve_metrics()
+                agent = _agents[key] = get_payment_agent(
+                    llm,
+                    use_async=use_async,
+                    checkpointer=get_conversation_store().checkpointer,
+                )
+    return agent
+
+
+def _turn_input(user_query: str, upi_state: dict | None):
+    """(upi_state with a thread id, graph input holding only the new message)"""
+    upi_state = upi_state or {}
+    upi_state.setdefault("thread_id", str(uuid.uuid4()))
+    # States from before checkpointing carried the whole history themselves
+    messages = list(upi_state.pop("messages", None) or [])
+    messages.append(HumanMessage(content=user_query))
+    return upi_state, {"messages": messages}
+
+
+def _start_turn():
+    """Fresh per-turn counters for the nodes of this turn to update"""
+    counts = {"graph_steps": 0, "llm_calls": 0, "mcp_calls": 0}
+    return counts, _turn_counts.set(counts), perf_counter()
+
+
+def _finish_turn(turn):
+    counts, token, started = turn
+    _turn_counts.reset(token)
+    observe("agent.turn", perf_counter() - started)
+    for name, value in counts.items():
+        observe_count(f"agent.{name}", value)
+    log.debug("Turn: %s", counts)
+
+
+def _final_reply(result):
+    messages = result.get("messages") if result else None
+    if messages:
+        return messages[-1].content
+    return "I couldn't process your UPI request."
 
 
 def run_upi_agent(user_query: str, llm, upi_state: dict | None = None):
     """
     Runs UPI agent with persistent state controlled by Supervisor.
+
+    upi_state only carries {"thread_id": ...}; the conversation itself is
+    checkpointed, so pass the same upi_state back in for the next turn.
     """
 
-    if upi_state is None or not upi_state:
-        agent = get_payment_agent(llm)
-        upi_state = {
-            "agent": agent,
-            "messages": []
-        }
-    else:
-        agent = upi_state["agent"]
+    agent = get_shared_payment_agent(llm)
+    conversations = get_conversation_store()
+    upi_state, turn = _turn_input(user_query, upi_state)
+    thread_id = upi_state["thread_id"]
 
-    # ✅ append new user message
-    upi_state["messages"].append(HumanMessage(content=user_query))
+    # ✅ only the new message goes in, history comes from the checkpointer
+    config = conversations.open(thread_id)
+    stats = _start_turn()
+    try:
+        result = agent.invoke(turn, config, durability="exit")
+    finally:
+        _finish_turn(stats)
+    conversations.persist(thread_id)
 
-    # ✅ invoke agent with full memory
-    result = agent.invoke({"messages": upi_state["messages"]})
+    return _final_reply(result), upi_state
 
-    # ✅ update memory from agent result
-    upi_state["messages"] = result.get("messages", upi_state["messages"])
 
-    # ✅ extract final assistant message
-    messages = upi_state["messages"]
-    if messages:
-        return messages[-1].content, upi_state
+async def arun_upi_agent(user_query: str, llm, upi_state: dict | None = None):
+    """
+    Async run_upi_agent: the whole turn runs on the caller's event loop.
+    """
+
+    agent = _agents.get((_llm_config_key(llm), True))
+    if agent is None:
+        # First build discovers tools (blocking), keep it off the event loop
+        agent = await asyncio.to_thread(get_shared_payment_agent, llm, True)
+    conversations = get_conversation_store()
+    upi_state, turn = _turn_input(user_query, upi_state)
+    thread_id = upi_state["thread_id"]
+
+    # Disk reads/writes of the conversation stay off the event loop
+    config = await asyncio.to_thread(conversations.open, thread_id)
+    stats = _start_turn()
+    try:
+        result = await agent.ainvoke(turn, config, durability="exit")
+    finally:
+        _finish_turn(stats)
+    await asyncio.to_thread(conversations.persist, thread_id)
 
-    return "I couldn't process your UPI request.", upi_state
+    return _final_reply(result), upi_state
@@ -1,6 +1,32 @@
-
 import asyncio
+import json
+import os
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import httpx
+from langchain_core.tools import ToolException
 from langchain_mcp_adapters.client import MultiServerMCPClient
+from langchain_mcp_adapters.tools import load_mcp_tools as load_session_tools
+from mcp.shared.exceptions import McpError
+from mcp.types import CONNECTION_CLOSED
+from upi_agent.instrumentation import get_logger
+
+
+MCP_SERVER_URL = os.environ.get("UPI_MCP_URL", "http://localhost:8000/mcp")
+
+log = get_logger("mcp")
+
+# A slow call: the session itself is fine, so it is not reopened
+TIMEOUT_ERRORS = (TimeoutError, asyncio.TimeoutError, FutureTimeoutError, httpx.TimeoutException)
+# The connection failed, not the tool
+TRANSPORT_ERRORS = (ConnectionError, httpx.TransportError)
+
+MCP_CONNECTIONS = {
+    "payment": {
+        "url": MCP_SERVER_URL,
+        "transport": "http",
+    }
+}
 
 
 # ==========================================
@@ -9,26 +35,250 @@ from langchain_mcp_adapters.client import MultiServerMCPClient
 async def get_mcp_tool_list():
     print(" Connecting to MCP server...")
 
-    client = MultiServerMCPClient(
-        {
-            "payment": {
-                "url": "http://localhost:8000/mcp",
-                "transport": "http",
-            }
-        }
-    )
+    client = MultiServerMCPClient(MCP_CONNECTIONS)
 
     tools = await client.get_tools()
 
-    
+
     for tool in tools:
         print(f"   • {tool.name}")
 
     return tools
 
+
+# ==========================================
+# PERSISTENT MCP SESSION
+# ==========================================
+class MCPSession:
+    """
+    One long-lived MCP client session shared by every tool call.
+
+    The session (and the HTTP connection pool under it) lives on a private
+    event loop in a background thread, so callers skip the per-call loop
+    setup and MCP handshake. Sync code uses call(), code already running on
+    another event loop awaits acall(), which never blocks that loop: opening
+    or reopening the session is awaited there, not waited on. If the server
+    goes away the session is reopened once and the call retried; a call
+    that only times out is cancelled and raised, leaving the session to the
+    other callers.
+
+    The tool list is discovered once and re-listed every `refresh_interval`
+    seconds on the session's own loop, so tools() never waits on the server.
+    """
+
+    def __init__(self, server_name="payment", connections=None, timeout=30,
+                 refresh_interval=300):
+        self.server_name = server_name
+        self.timeout = timeout
+        self.refresh_interval = refresh_interval
+        self._client = MultiServerMCPClient(connections or MCP_CONNECTIONS)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="mcp-session", daemon=True
+        )
+        self._thread.start()
+        self._lock = threading.Lock()
+        self._tools = None
+        self._closing = None
+        self._runner = None
+        self._opening = None
+
+    async def _hold_session(self, ready):
+        """Keep the session open until close(); it must exit in this task"""
+        self._closing = asyncio.Event()
+        async with self._client.session(self.server_name) as session:
+            tools = await load_session_tools(session)
+            self._tools = {tool.name: tool for tool in tools}
+            ready.set_result(True)
+            while True:
+                try:
+                    await asyncio.wait_for(self._closing.wait(), self.refresh_interval)
+                    return
+                except asyncio.TimeoutError:
+                    await self._refresh_tools(session)
+
+    async def _refresh_tools(self, session):
+        try:
+            tools = await load_session_tools(session)
+        except Exception as e:
+            log.warning(" MCP tool refresh failed: %s", e)
+            return
+        self._tools = {tool.name: tool for tool in tools}
+
+    async def _stop_session(self):
+        """Close the current session (runs on the session loop)"""
+        if self._runner is not None and not self._runner.done():
+            self._closing.set()
+            await asyncio.wait([self._runner], timeout=5)
+        self._runner = None
+
+    async def _reopen(self):
+        """(Re)open the session (runs on the session loop)"""
+        await self._stop_session()
+        ready = self._loop.create_future()
+        runner = asyncio.ensure_future(self._hold_session(ready))
+
+        def on_exit(task):
+            error = None if task.cancelled() else task.exception()
+            if not ready.done():
+                ready.set_exception(error or ConnectionError("MCP session closed"))
+            elif error is not None:
+                log.warning(" MCP session closed: %r", error)
+
+        runner.add_done_callback(on_exit)
+        self._runner = runner
+        try:
+            await asyncio.wait_for(ready, self.timeout)
+        except BaseException:
+            runner.cancel()
+            raise
+        log.info(" MCP session open: %s", ", ".join(self._tools))
+
+    def _start(self, stale=None):
+        """
+        Future of the session being (re)opened, or None if it is open.
+
+        `stale` is a session runner a caller saw fail; it is replaced unless
+        someone already did. The work runs on the session loop and
+        concurrent callers share one future, so the lock is only held for
+        this handoff, never while waiting on the server.
+        """
+        with self._lock:
+            if self._opening is not None and not self._opening.done():
+                return self._opening
+            runner = self._runner
+            if runner is not None and not runner.done() and runner is not stale:
+                return None
+            self._opening = asyncio.run_coroutine_threadsafe(self._reopen(), self._loop)
+            return self._opening
+
+    def _ensure_open(self, stale=None):
+        opening = self._start(stale)
+        if opening is not None:
+            opening.result(self.timeout)
+
+    async def _aensure_open(self, stale=None):
+        """_ensure_open for callers on another event loop; never blocks it"""
+        opening = self._start(stale)
+        if opening is not None:
+            # shield: a caller timing out must not cancel the shared open
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(opening)), self.timeout)
+
+    def reconnect(self):
+        """Drop the current session and open a new one"""
+        self._ensure_open(stale=self._runner)
+
+    def tools(self):
+        """{name: tool} discovered on the live session (cached)"""
+        self._ensure_open()
+        return dict(self._tools)
+
+    def cached_tools(self):
+        """tools() as last discovered, without opening or waiting on the session"""
+        return dict(self._tools or {})
+
+    async def _invoke(self, runner, name, arguments):
+        """Run a tool on the session loop; fails as soon as its session dies"""
+        if name not in self._tools:
+            raise KeyError(f"Unknown MCP tool: {name}")
+        call = asyncio.ensure_future(self._tools[name].ainvoke(arguments))
+        await asyncio.wait([call, runner], return_when=asyncio.FIRST_COMPLETED)
+        if not call.done():
+            call.cancel()
+            raise ConnectionError("MCP session closed")
+        try:
+            return call.result()
+        except McpError as e:
+            if e.error.code != CONNECTION_CLOSED and e.error.message != "Session terminated":
+                raise
+            # The server no longer knows this session (e.g. it restarted
+            # quickly): end it, so the caller's retry opens a new one
+            runner.cancel()
+            await asyncio.wait([runner], timeout=5)
+            raise ConnectionError(f"MCP session ended by the server: {e}") from e
+
+    def _submit(self, name, arguments):
+        """(session runner, future of the call on that session)"""
+        runner = self._runner
+        return runner, asyncio.run_coroutine_threadsafe(self._invoke(runner, name, arguments), self._loop)
+
+    @staticmethod
+    def _session_died(error, runner):
+        """Whether a call failed because its session is gone (worth one retry)"""
+        if isinstance(error, TIMEOUT_ERRORS) or not isinstance(error, TRANSPORT_ERRORS):
+            return False
+        return runner is not None and runner.done()
+
+    def call(self, name, arguments):
+        """Invoke an MCP tool from synchronous code"""
+        self._ensure_open()
+        runner, future = self._submit(name, arguments)
+        try:
+            return future.result(self.timeout)
+        except Exception as e:
+            future.cancel()
+            if not self._session_died(e, runner):
+                raise
+            # e.g. server restarted: new session, one retry
+            self._ensure_open(stale=runner)
+            return self._submit(name, arguments)[1].result(self.timeout)
+
+    async def acall(self, name, arguments):
+        """Invoke an MCP tool from any event loop"""
+        await self._aensure_open()
+        runner, future = self._submit(name, arguments)
+        try:
+            # a timeout cancels the wrapped call on the session loop too
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except Exception as e:
+            if not self._session_died(e, runner):
+                raise
+            await self._aensure_open(stale=runner)
+            _, future = self._submit(name, arguments)
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+
+    def close(self):
+        try:
+            asyncio.run_coroutine_threadsafe(self._stop_session(), self._loop).result(self.timeout)
+        except Exception:
+            pass
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_mcp_session():
+    """Process-wide MCPSession, opened on first use"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = MCPSession()
+        return _session
+
+
 def load_mcp_tools():
-    tools = asyncio.run(get_mcp_tool_list())
-    return {tool.name: tool for tool in tools}
+    return get_mcp_session().tools()
+
+
+def tool_payload(result):
+    """The JSON object an MCP tool returned (its text content blocks), or None"""
+    if isinstance(result, dict) and "type" not in result:
+        return result
+    if isinstance(result, str):
+        text = result
+    else:
+        blocks = result if isinstance(result, list) else [result]
+        text = "".join(
+            block.get("text", "") for block in blocks
+            if isinstance(block, dict) and block.get("type") == "text"
+        )
+    try:
+        payload = json.loads(text)
+    except (TypeError, ValueError):
+        return None
+    return payload if isinstance(payload, dict) else None
 
 
 if __name__ == "__main__":
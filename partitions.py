@@ -0,0 +1,331 @@
+"""
+partitions.py - Date-partitioned transaction data
+
+A partitioned dataset is a directory with one file per day plus a manifest:
+
+    transactions/
+        manifest.json          {"partitions": {"2024-12-23": {"file": ..., "count": ...}}}
+        2024-12-23.snap        (or .jsonl: any single-file format storage.py reads)
+        2024-12-24.snap
+        undated.snap           rows whose date is not a valid YYYY-MM-DD, if any
+
+Nothing is loaded up front. A query for a date loads only that day's file,
+and loaded days are kept in a bounded LRU (UPI_PARTITION_CACHE days,
+default 64) shared by every version of the dataset. Memory therefore
+follows the days being asked about, not the length of the history.
+Queries without a date visit every partition, one at a time, without
+adding them to the LRU, so a full scan does not evict the days in use.
+Their results come in date order (undated last) rather than the order of
+the source file.
+
+The manifest is written last, so the store's poll sees a consistent set of
+files. It records each day file's (mtime, size); cached days are keyed by
+path and that signature, so a rewritten day is reloaded and unchanged days
+survive a reload.
+"""
+
+import heapq
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+
+from binary_snapshot import write_binary_snapshot
+from instrumentation import get_logger, observe
+from storage import file_signature, iter_transactions_file, open_backend
+from transaction_store import MatchResult, TransactionSnapshot, _date_ordinal
+
+MANIFEST_NAME = "manifest.json"
+UNDATED = "undated"
+PARTITION_CACHE_SIZE = int(os.environ.get("UPI_PARTITION_CACHE", 64))
+
+log = get_logger("partitions")
+
+
+def partition_name(date):
+    """Partition a row with this date goes to"""
+    return date if _date_ordinal(date) >= 0 else UNDATED
+
+
+# ==========================================
+# WRITER
+# ==========================================
+
+def write_partitions(transactions, directory, file_format="binary", chunk_size=10000):
+    """
+    Split transactions (any iterable of dicts) into one file per day.
+
+    Rows are first spilled to per-day JSON Lines files in `chunk_size`
+    batches, so memory stays bounded by the busiest day. With the "binary"
+    format each day is then encoded into a memory-mappable .snap file.
+    Returns the row count.
+    """
+    os.makedirs(directory, exist_ok=True)
+    staging = os.path.join(directory, ".staging")
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    buffers, counts = {}, {}
+
+    def spill(name):
+        with open(os.path.join(staging, name + ".jsonl"), "a") as f:
+            f.write("".join(buffers.pop(name)))
+
+    for txn in transactions:
+        name = partition_name(txn.get("date"))
+        buffers.setdefault(name, []).append(json.dumps(txn, separators=(",", ":")) + "\n")
+        counts[name] = counts.get(name, 0) + 1
+        if len(buffers[name]) >= chunk_size:
+            spill(name)
+    for name in list(buffers):
+        spill(name)
+
+    partitions = {}
+    for name in sorted(counts):
+        staged = os.path.join(staging, name + ".jsonl")
+        if file_format == "binary":
+            filename = name + ".snap"
+            write_binary_snapshot(iter_transactions_file(staged), os.path.join(directory, filename))
+        else:
+            filename = name + ".jsonl"
+            os.replace(staged, os.path.join(directory, filename))
+        partitions[name] = {
+            "file": filename,
+            "count": counts[name],
+            "signature": file_signature(os.path.join(directory, filename)),
+        }
+    shutil.rmtree(staging, ignore_errors=True)
+
+    # Manifest last: readers only ever see complete days
+    manifest_path = os.path.join(directory, MANIFEST_NAME)
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump({"format": 1, "partitions": partitions}, f, indent=1)
+    os.replace(manifest_path + ".tmp", manifest_path)
+    return sum(counts.values())
+
+
+# ==========================================
+# PARTITION CACHE
+# ==========================================
+
+class PartitionCache:
+    """Thread-safe LRU of loaded day files, keyed by (path, file signature)"""
+
+    def __init__(self, max_partitions=PARTITION_CACHE_SIZE):
+        self.max_partitions = max_partitions
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading = {}
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+        self.scans = 0
+
+    def get(self, key, load):
+        """Cached snapshot for `key`, else load() it (once, even if raced)"""
+        with self._lock:
+            snapshot = self._entries.get(key)
+            if snapshot is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return snapshot
+            loading = self._loading.setdefault(key, threading.Lock())
+
+        with loading:
+            with self._lock:
+                snapshot = self._entries.get(key)
+                if snapshot is not None:
+                    self.hits += 1
+                    return snapshot
+            try:
+                snapshot = load()
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+            with self._lock:
+                if snapshot is None or self.max_partitions <= 0:
+                    return snapshot
+                self.loads += 1
+                self._entries[key] = snapshot
+                while len(self._entries) > self.max_partitions:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+            return snapshot
+
+    def scan(self, key, load):
+        """Cached snapshot for `key`, else load() it without caching it"""
+        with self._lock:
+            snapshot = self._entries.get(key)
+            if snapshot is not None:
+                self.hits += 1
+                return snapshot
+            self.scans += 1
+        return load()
+
+    def nbytes(self):
+        with self._lock:
+            snapshots = list(self._entries.values())
+        return sum(s.nbytes() for s in snapshots if hasattr(s, "nbytes"))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "partitions": len(self._entries),
+                "max_partitions": self.max_partitions,
+                "hits": self.hits,
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "scans": self.scans,
+            }
+
+
+# ==========================================
+# SNAPSHOT
+# ==========================================
+
+class PartitionedSnapshot:
+    """
+    One version of a partitioned dataset; same interface as TransactionSnapshot.
+
+    Only the manifest is read up front. Day files are loaded through the
+    shared PartitionCache when a query first needs them.
+    """
+
+    def __init__(self, directory, cache, version=0, signature=None):
+        with open(os.path.join(directory, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+        self.directory = directory
+        self.partitions = manifest["partitions"]
+        self.cache = cache
+        self.version = version
+        self.signature = signature
+        self.loaded_at = time.time()
+        self._count = sum(entry["count"] for entry in self.partitions.values())
+
+    def __len__(self):
+        return self._count
+
+    def _load(self, name, keep=True):
+        """
+        Snapshot of one partition (empty if it is missing or unreadable).
+
+        keep=False reads it without adding it to the cache, for full scans.
+        """
+        entry = self.partitions[name]
+        path = os.path.join(self.directory, entry["file"])
+        # Recorded by the writer; saves a stat() per query
+        signature = entry.get("signature") or file_signature(path)
+        if isinstance(signature, list):
+            signature = tuple(tuple(part) if isinstance(part, list) else part for part in signature)
+
+        def load():
+            if not os.path.exists(path):
+                # Not cached, so the day is read once its file is written
+                log.error(" Error: %s not found", path)
+                return None
+            started = time.perf_counter()
+            snapshot = open_backend(path).load(version=self.version, signature=signature)
+            elapsed = time.perf_counter() - started
+            observe("store.partition_load", elapsed)
+            log.debug(" Loaded partition %s (%.1f ms)", name, elapsed * 1000)
+            return snapshot
+
+        get = self.cache.get if keep else self.cache.scan
+        snapshot = get((path, signature), load)
+        if snapshot is None:
+            return TransactionSnapshot([], version=self.version)
+        return snapshot
+
+    def _partition(self, date):
+        name = partition_name(date)
+        return self._load(name) if name in self.partitions else None
+
+    def _all(self):
+        """Every partition, in date order (undated last), read past the LRU"""
+        for name in sorted(self.partitions, key=lambda n: (n == UNDATED, n)):
+            yield self._load(name, keep=False)
+
+    def count_on(self, date):
+        name = partition_name(date)
+        if name not in self.partitions:
+            return 0
+        if name == UNDATED:
+            return self._load(name).count_on(date)
+        return self.partitions[name]["count"]
+
+    def search(self, date=None, sender_last4=None, seconds=None, amount=None, limit=None):
+        filters = {"sender_last4": sender_last4, "seconds": seconds, "amount": amount}
+        return self.match(date, filters, limit=limit).exact
+
+    def match(self, date=None, exact=None, fallback=None, limit=None):
+        if date is not None:
+            partition = self._partition(date)
+            if partition is None:
+                return MatchResult()
+            return partition.match(date, exact, fallback, limit)
+
+        # No date: exact matches across all days in date order, then
+        # fallback if none
+        result = MatchResult(date_count=len(self))
+        for position, filters in enumerate((exact, fallback)):
+            if position and (filters is None or result.exact):
+                break
+            found = []
+            for partition in self._all():
+                remaining = None if limit is None else limit - len(found)
+                if remaining is not None and remaining <= 0:
+                    break
+                found += partition.match(None, filters, limit=remaining).exact
+            if position:
+                result.fallback = found
+            else:
+                result.exact = found
+        return result
+
+    def rank(self, date=None, filters=None, limit=10):
+        if date is not None:
+            partition = self._partition(date)
+            return partition.rank(date, filters, limit) if partition is not None else []
+        if limit is None or limit <= 0:
+            return []
+        # Each day's list is sorted by score; merging keeps date order on ties
+        per_day = [partition.rank(None, filters, limit) for partition in self._all()]
+        return list(heapq.merge(*per_day, key=lambda pair: pair[0]))[:limit]
+
+    def nbytes(self):
+        """Bytes held by the partitions currently cached"""
+        return self.cache.nbytes()
+
+
+# ==========================================
+# BACKEND
+# ==========================================
+
+class PartitionedBackend:
+    """Directory written by `python create_db.py --partitioned`"""
+
+    def __init__(self, path, cache=None):
+        self.path = path
+        self.cache = cache or PartitionCache()
+
+    def describe(self):
+        return f"{self.path} (partitioned)"
+
+    def signature(self):
+        # Writers replace the manifest after the day files
+        return file_signature(os.path.join(self.path, MANIFEST_NAME))
+
+    def load(self, version, signature):
+        try:
+            return PartitionedSnapshot(self.path, self.cache, version=version, signature=signature)
+        except FileNotFoundError:
+            log.error(" Error: %s not found", os.path.join(self.path, MANIFEST_NAME))
+            return TransactionSnapshot([], version=version, signature=signature)
+        except (ValueError, KeyError, TypeError) as e:
+            log.error(" Error: Unreadable partition manifest - %s", e)
+            return None
+
+    def stats(self):
+        return self.cache.stats()
@@ -564,4 +564,24 @@ Remember:
 - Extract number from amount (₹2941.80 → 2941.8)
 - Extract 4 digits from account (last 4: 2006 → "2006")
 - ONLY call get_transaction_details when you have ALL FOUR pieces
-"""
\ No newline at end of file
+"""
+
+# ==========================================
+# PREFIX-CACHE LAYOUT
+# ==========================================
+# The instruction block goes first and is byte-identical on every call, so
+# an inference server with prefix (KV) caching can reuse it; the date and
+# the history follow it in the human message. It is a finished string, not
+# a template: no variables, braces already unescaped.
+STATIC_SYSTEM_PROMPT = (
+    SYSTEM_PROMPT_TEMPLATE
+    .replace("today's date: {current_date}\n", "", 1)
+    .replace("use {current_date}", "use today's date")
+    .replace("{current_date}", "today's date")
+    .replace("{{", "{")
+    .replace("}}", "}")
+)
+
+CONTEXT_PROMPT_TEMPLATE = """
+Today's date: {current_date}
+""" + HUMAN_PROMPT_TEMPLATE
@@ -0,0 +1,93 @@
+"""
+renderer.py - Templated answers for get_transaction_details results
+
+The common outcomes are turned into the user-facing message directly,
+in the formats prompts.py asks the LLM for, so no LLM call is needed:
+
+    one exact match              the transaction block
+    one fuzzy match (warning)    the block plus a last-4 digits warning
+    no match, time was given     retry once without time (broader search)
+    no match after that          the "couldn't find" message
+
+Anything else (several matches, ranked results, errors) returns None and
+the LLM decides what to say.
+"""
+
+RETRY = "retry"
+ANSWER = "answer"
+
+_FIELDS = (
+    ("Transaction ID", "txn_id"),
+    ("Date", "date"),
+    ("Time", "time"),
+    ("Amount", "amount"),
+    ("Sender Last 4 Digits", "sender_last4"),
+    ("Receiver Account Number", "receiver_account_no"),
+    ("Sender Bank Name", "sender_bank_name"),
+    ("Status", "status"),
+    ("Description", "description"),
+)
+
+
+def _amount(value):
+    if isinstance(value, (int, float)):
+        return f"₹{value:.2f}"
+    return f"₹{value}"
+
+
+def format_transaction_block(txn):
+    lines = []
+    for label, key in _FIELDS:
+        value = txn.get(key)
+        lines.append(f"{label}: {_amount(value) if key == 'amount' else value}")
+    return "\n".join(lines)
+
+
+def _no_match_message(slots):
+    return (
+        "I couldn't find any transactions matching your details. Could you please "
+        "verify the information you provided? Specifically:\n"
+        f"- Date: {slots.get('date')}\n"
+        f"- Time: {slots.get('time')}\n"
+        f"- Amount: {_amount(slots.get('amount'))}\n"
+        f"- Last 4 digits: {slots.get('sender_last4')}\n\n"
+        "If you're still having trouble, you might want to check your transaction "
+        "history or contact your bank for more assistance."
+    )
+
+
+def render_transaction_result(payload, tool_input, slots=None):
+    """
+    (ANSWER, message) or (RETRY, broader tool input) for a result the
+    templates cover, else None.
+
+    `tool_input` is what the tool was called with; `slots` are the details
+    the user gave, quoted back when nothing is found.
+    """
+    if not isinstance(payload, dict):
+        return None
+    slots = {**(tool_input or {}), **{k: v for k, v in (slots or {}).items() if v is not None}}
+    transactions = payload.get("transactions") or []
+
+    if payload.get("success") and len(transactions) == 1:
+        txn = transactions[0]
+        if "score" in txn:
+            return None
+        block = format_transaction_block(txn)
+        if payload.get("warning"):
+            return ANSWER, (
+                "I couldn't find an exact match, but found this transaction with the "
+                "same date, time and amount. The last 4 digits on it "
+                f"({txn.get('sender_last4')}) don't match the ones you gave "
+                f"({slots.get('sender_last4')}) - please verify your account details.\n\n"
+                + block
+            )
+        return ANSWER, block
+
+    if not payload.get("success") and not transactions and "debug_info" in payload:
+        if (tool_input or {}).get("time"):
+            broader = {k: v for k, v in tool_input.items() if k != "time"}
+            return RETRY, broader
+        return ANSWER, _no_match_message(slots)
+
+    return None
@@ -0,0 +1,111 @@
+"""
+result_cache.py - LRU cache of get_transaction_details responses
+
+Grievance traffic keeps asking about the same recent transactions, so the
+server remembers finished responses keyed by the normalized arguments
+(including last_n, fuzzy_search and ranked). The cache is bounded both by
+entry count and by the approximate JSON size of the responses.
+
+Every entry carries the version of the data it was computed from, scoped
+to the query's date (transaction_store.dataset_version), and is only
+served while that version is current. A reload changes every version,
+but rows ingested live only invalidate the dates they belong to.
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict
+
+RESULT_CACHE_SIZE = int(os.environ.get("UPI_RESULT_CACHE_SIZE", 4096))
+RESULT_CACHE_BYTES = int(os.environ.get("UPI_RESULT_CACHE_BYTES", 32 * 1024 * 1024))
+
+
+def result_key(date=None, time=None, amount=None, sender_last4=None,
+               last_n=10, fuzzy_search=True, ranked=False):
+    """
+    Cache key for get_transaction_details arguments.
+
+    Arguments the search treats the same share a key: "18:18" and
+    "18:18:00", a "0000" last4 and none. A "00:00:00" time or a non-positive
+    amount keeps its own key: the exact pass ignores them, but the fuzzy
+    pass still searches around them.
+    """
+    # "00:00" is a real time filter, unlike "00:00:00"
+    if time and len(time) == 5 and time != "00:00":
+        time += ":00"
+    if sender_last4 == "0000":
+        sender_last4 = None
+    return (
+        date or None,
+        time or None,
+        float(amount) if amount is not None else None,
+        sender_last4 or None,
+        last_n,
+        bool(fuzzy_search),
+        bool(ranked),
+    )
+
+
+class ResultCache:
+    """Thread-safe LRU of key -> (response, version of the data it read)"""
+
+    def __init__(self, max_entries=RESULT_CACHE_SIZE, max_bytes=RESULT_CACHE_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, version):
+        """Cached response for `key` if it was computed under `version`, else None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] != version:
+                # The data it read has changed since
+                del self._entries[key]
+                self.nbytes -= entry[1]
+                self.invalidations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, response, version):
+        if self.max_entries <= 0:
+            return
+        size = len(json.dumps(response, default=str))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[1]
+            self._entries[key] = (response, size, version)
+            self.nbytes += size
+            while len(self._entries) > self.max_entries or self.nbytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self.nbytes -= evicted_size
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.nbytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
@@ -1,29 +1,182 @@
-import json
 import os
 from typing import Optional
 from mcp.server.fastmcp import FastMCP
-from datetime import datetime
+from pydantic import BaseModel
+from starlette.responses import JSONResponse, PlainTextResponse
+from ingest import INGEST_LOG, IngestLog, LogTailer
+from instrumentation import get_logger, render_metrics, timed
+from result_cache import ResultCache, result_key
+from storage import open_backend
+from transaction_store import TransactionStore, dataset_version, parse_seconds
 
-mcp = FastMCP("PaymentAgent")
+# Port for the streamable-http transport
+MCP_PORT = int(os.environ.get("UPI_MCP_PORT", 8000))
+
+mcp = FastMCP("PaymentAgent", port=MCP_PORT)
+log = get_logger("server")
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 JSON_PATH = os.path.join(BASE_DIR, "transactions.json")
 
+# Data source: transactions.json by default, or e.g. transactions.db /
+# transactions.snap (see create_db.py). The backend follows the file
+# extension unless UPI_STORAGE_BACKEND is set to "json", "sqlite" or "binary".
+DATA_PATH = os.environ.get("UPI_TRANSACTIONS_PATH", JSON_PATH)
+STORAGE_BACKEND = os.environ.get("UPI_STORAGE_BACKEND") or None
 
-def load_transactions():
-    """Load transactions from JSON file"""
-    try:
-        print(f" Reading from: {JSON_PATH}")
-        with open(JSON_PATH, 'r') as f:
-            data = json.load(f)
-        print(f" Loaded {len(data)} transactions")
-        return data
-    except FileNotFoundError:
-        print(f" Error: {JSON_PATH} not found")
-        return []
-    except json.JSONDecodeError as e:
-        print(f" Error: Invalid JSON format - {str(e)}")
-        return []
+
+# Loaded once and refreshed in the background when the data changes
+store = TransactionStore(open_backend(DATA_PATH, STORAGE_BACKEND))
+
+# Rows appended to UPI_INGEST_LOG are applied live (see ingest.py)
+ingest_tailer = LogTailer(store, IngestLog(INGEST_LOG)) if INGEST_LOG else None
+
+# Finished responses for the current dataset version
+result_cache = ResultCache()
+
+MAX_BATCH_QUERIES = int(os.environ.get("UPI_MAX_BATCH_QUERIES", 1000))
+
+# ingest_transactions writes data, and the agent offers every server tool
+# to its LLM, so it is only registered on request
+INGEST_TOOL = os.environ.get("UPI_INGEST_TOOL") == "1"
+MAX_INGEST_ROWS = int(os.environ.get("UPI_MAX_INGEST_ROWS", 10000))
+
+
+def format_transaction(txn):
+    return {
+        "txn_id": txn.get('txn_id'),
+        "date": txn.get('date'),
+        "time": txn.get('time'),
+        "amount": txn.get('amount'),
+        "sender_last4": txn.get('sender_last4'),
+        "receiver_account_no": txn.get('receiver_account_no'),
+        "receiver_bank_name": txn.get('receiver_bank_name'),
+        "sender_bank_name": txn.get('sender_bank_name'),
+        "status": txn.get('status'),
+        "description": txn.get('description'),
+        "failure_reason": txn.get('failure_reason')
+    }
+
+
+def search_transactions(snapshot, date=None, time=None, amount=None,
+                        sender_last4=None, last_n=10, fuzzy_search=True, ranked=False):
+    """get_transaction_details against one snapshot (response without dataset_version)"""
+    if not len(snapshot):
+        return {
+            "success": False,
+            "count": 0,
+            "message": "No transactions found in database",
+            "transactions": []
+        }
+
+    log.debug("\n TRANSACTION SEARCH:\n   Total transactions: %d\n   Filters:\n"
+              "     - Date: %s\n     - Time: %s\n     - Amount: %s\n     - Sender Last4: %s",
+              len(snapshot), date, time, amount, sender_last4)
+
+    # EXACT MATCH FILTERS
+    exact_filters = {}
+
+    if sender_last4 and sender_last4 != "0000":
+        exact_filters["sender_last4"] = sender_last4
+
+    if time and time != "00:00:00":
+        if len(time) == 5:
+            time += ":00"
+
+        user_seconds = parse_seconds(time)
+        if user_seconds is None:
+            log.warning("    Time parsing error: invalid time %r", time)
+        else:
+            exact_filters["seconds"] = user_seconds  # ±30 min
+
+    if amount is not None and amount > 0:
+        exact_filters["amount"] = amount  # ±50
+
+    # RANKED SEARCH: closest first instead of hard windows
+    if ranked:
+        with timed("search.rank"):
+            ranked_matches = snapshot.rank(date or None, exact_filters, limit=last_n)
+        log.info("   Returning %d ranked match(es)", len(ranked_matches))
+        if ranked_matches:
+            with timed("search.format"):
+                transactions = [
+                    {**format_transaction(txn), "score": round(score, 4)}
+                    for score, txn in ranked_matches
+                ]
+            return {
+                "success": True,
+                "count": len(ranked_matches),
+                "message": f"Found {len(ranked_matches)} closest transaction(s), best match first (lower score is closer).",
+                "transactions": transactions
+            }
+
+    # FUZZY FILTERS: date + time + amount (ignore last4)
+    fuzzy_filters = None
+    if fuzzy_search and date and time and amount:
+        user_seconds = parse_seconds(time if len(time) == 8 else time + ":00")
+        if user_seconds is not None:
+            fuzzy_filters = {"seconds": user_seconds, "amount": amount}
+
+    # Exact matches, fuzzy matches and counts come from one pass
+    with timed("search.match"):
+        result = snapshot.match(date or None, exact_filters, fuzzy_filters, limit=last_n)
+    filtered, fuzzy_matches = result.exact, result.fallback
+
+    # IF EXACT MATCHES FOUND
+    if filtered:
+        log.info("   Returning %d exact match(es)", len(filtered))
+        with timed("search.format"):
+            transactions = [format_transaction(txn) for txn in filtered]
+        return {
+            "success": True,
+            "count": len(filtered),
+            "message": f"Found {len(filtered)} transaction(s).",
+            "transactions": transactions
+        }
+
+    # IF NO EXACT MATCHES BUT FUZZY MATCHES
+    if fuzzy_matches:
+        log.info("    Found %d fuzzy match(es) (ignoring last4)", len(fuzzy_matches))
+        with timed("search.format"):
+            transactions = [format_transaction(txn) for txn in fuzzy_matches]
+
+        return {
+            "success": True,
+            "count": len(fuzzy_matches),
+            "message": f"No exact match found, but found {len(fuzzy_matches)} transaction(s) with matching date, time, and amount. The last 4 digits might be different - please verify.",
+            "transactions": transactions,
+            "warning": "Account number last 4 digits don't match. Please verify your account details."
+        }
+
+    # NO MATCHES AT ALL
+    log.info("   No matches found")
+
+    # Provide helpful debugging info
+    debug_info = []
+    if date:
+        debug_info.append(f"{result.date_count} transactions on {date}")
+
+    return {
+        "success": False,
+        "count": 0,
+        "message": "No transactions found matching the criteria.",
+        "transactions": [],
+        "debug_info": " | ".join(debug_info) if debug_info else "No transactions found in database for this date"
+    }
+
+
+def cached_search(snapshot, query):
+    """search_transactions for one query dict, through the result cache"""
+    # Scoped to the date: live ingestion for other dates keeps it valid
+    version = dataset_version(snapshot, query["date"] or None)
+    key = result_key(**query)
+    response = result_cache.get(key, version)
+    if response is None:
+        with timed("search.total"):
+            response = search_transactions(snapshot, **query)
+        response["dataset_version"] = version
+        result_cache.put(key, response, version)
+    return response
 
 
 @mcp.tool()
@@ -33,7 +186,8 @@ def get_transaction_details(
     amount: Optional[float] = None,
     sender_last4: Optional[str] = None,
     last_n: int = 10,
-    fuzzy_search: bool = True  # NEW: Enable fuzzy matching by default
+    fuzzy_search: bool = True,  # NEW: Enable fuzzy matching by default
+    ranked: bool = False
 ):
     """
     Returns UPI transaction details based on filters.
@@ -45,6 +199,9 @@ def get_transaction_details(
         sender_last4 (Optional[str]): Last 4 digits of sender account number.
         last_n (int): Maximum number of results to return (default: 10).
         fuzzy_search (bool): If True, returns close matches when exact match fails.
+        ranked (bool): If True, ignores the ±30 min / ±50 cutoffs and returns the
+            last_n transactions of the date closest to time, amount and last4,
+            best first, each with a "score" (0 = perfect match).
 
     Output:
         {
@@ -52,187 +209,222 @@ def get_transaction_details(
             "count": <int>,
             "message": <str>,
             "transactions": [...],
-            "fuzzy_matches": [...] (optional - only if fuzzy_search enabled)
+            "fuzzy_matches": [...] (optional - only if fuzzy_search enabled),
+            "dataset_version": <str> (changes when the data for this date
+                changes: a reload, or rows ingested for the date)
         }
+        In ranked mode every transaction also carries "score".
     """
     try:
-        all_transactions = load_transactions()
-        
-        if not all_transactions:
-            return {
-                "success": False,
-                "count": 0,
-                "message": "No transactions found in database",
-                "transactions": []
-            }
+        snapshot = store.snapshot()
+        return cached_search(snapshot, {
+            "date": date,
+            "time": time,
+            "amount": amount,
+            "sender_last4": sender_last4,
+            "last_n": last_n,
+            "fuzzy_search": fuzzy_search,
+            "ranked": ranked,
+        })
+
+    except Exception as e:
+        log.exception("Error in get_transaction_details: %s", e)
+        return {
+            "success": False,
+            "count": 0,
+            "message": f"Database error: {str(e)}",
+            "transactions": []
+        }
 
-        print(f"\n TRANSACTION SEARCH:")
-        print(f"   Total transactions: {len(all_transactions)}")
-        print(f"   Filters:")
-        print(f"     - Date: {date}")
-        print(f"     - Time: {time}")
-        print(f"     - Amount: {amount}")
-        print(f"     - Sender Last4: {sender_last4}")
 
-        # EXACT MATCH SEARCH
-        filtered = all_transactions.copy()
+class TransactionQuery(BaseModel):
+    """One filter set of get_transaction_details_batch"""
+    date: Optional[str] = None
+    time: Optional[str] = None
+    amount: Optional[float] = None
+    sender_last4: Optional[str] = None
+    last_n: int = 10
+    fuzzy_search: bool = True
+    ranked: bool = False
 
-        if date:
-            filtered = [txn for txn in filtered if txn.get('date') == date]
-            print(f"   ✓ After date filter: {len(filtered)}")
 
-        if sender_last4 and sender_last4 != "0000":
-            filtered = [
-                txn for txn in filtered 
-                if txn.get('sender_last4') == sender_last4
-            ]
-            print(f"   ✓ After sender_last4 filter: {len(filtered)}")
+@mcp.tool()
+def get_transaction_details_batch(queries: list[TransactionQuery]):
+    """
+    Resolves many transaction lookups in one call.
 
-        if time and time != "00:00:00":
-            if len(time) == 5:
-                time += ":00"
+    Parameters:
+        queries (list): Filter sets, each with the get_transaction_details
+            arguments (date, time, amount, sender_last4, last_n,
+            fuzzy_search, ranked).
 
+    Output:
+        {
+            "success": <bool>,
+            "count": <int>,
+            "dataset_version": <str> (whole dataset; each result has its date's),
+            "results": [<get_transaction_details output>, ...]  (same order as queries)
+        }
+    All queries see the same data version. A failing query gets its own
+    error result; the others are still answered.
+    """
+    if len(queries) > MAX_BATCH_QUERIES:
+        return {
+            "success": False,
+            "count": 0,
+            "message": f"Too many queries: {len(queries)} (max {MAX_BATCH_QUERIES})",
+            "results": []
+        }
+
+    snapshot = store.snapshot()
+    version = dataset_version(snapshot)
+    log.info(" BATCH SEARCH: %d queries", len(queries))
+
+    # Same-date queries run back to back against the same date index;
+    # duplicates are answered once
+    results = [None] * len(queries)
+    answered = {}
+    order = sorted(range(len(queries)), key=lambda i: queries[i].date or "")
+    for i in order:
+        query = queries[i].model_dump()
+        key = result_key(**query)
+        if key not in answered:
             try:
-                user_time = datetime.strptime(time, "%H:%M:%S")
-
-                def time_close(txn_time):
-                    try:
-                        txn_dt = datetime.strptime(txn_time, "%H:%M:%S")
-                        time_diff = abs((txn_dt - user_time).total_seconds())
-                        return time_diff <= 1800  # 30 minutes
-                    except:
-                        return False
-
-                filtered = [
-                    txn for txn in filtered
-                    if txn.get("time") and time_close(txn["time"])
-                ]
-                print(f"    After time filter (±30 min): {len(filtered)}")
-                            
+                answered[key] = cached_search(snapshot, query)
             except Exception as e:
-                print(f"    Time parsing error: {e}")
+                log.exception("Error in get_transaction_details_batch: %s", e)
+                answered[key] = {
+                    "success": False,
+                    "count": 0,
+                    "message": f"Database error: {str(e)}",
+                    "transactions": []
+                }
+        results[i] = answered[key]
 
-        if amount is not None and amount > 0:
-            filtered = [
-                txn for txn in filtered
-                if abs(txn.get("amount", 0) - amount) <= 50
-            ]
-            print(f"    After amount filter (±50): {len(filtered)}")
+    return {
+        "success": True,
+        "count": len(results),
+        "dataset_version": version,
+        "results": results
+    }
 
-        # Limit results
-        filtered = filtered[:last_n]
 
-        # FORMAT TRANSACTIONS
-        def format_transaction(txn):
-            return {
-                "txn_id": txn.get('txn_id'),
-                "date": txn.get('date'),
-                "time": txn.get('time'),
-                "amount": txn.get('amount'),
-                "sender_last4": txn.get('sender_last4'),
-                "receiver_account_no": txn.get('receiver_account_no'),
-                "receiver_bank_name": txn.get('receiver_bank_name'),
-                "sender_bank_name": txn.get('sender_bank_name'),
-                "status": txn.get('status'),
-                "description": txn.get('description'),
-                "failure_reason": txn.get('failure_reason')
-            }
+@mcp.tool()
+def get_store_version(date: Optional[str] = None):
+    """
+    Returns the current dataset version of the transaction store.
 
-        # IF EXACT MATCHES FOUND
-        if filtered:
-            print(f"   Returning {len(filtered)} exact match(es)\n")
-            return {
-                "success": True,
-                "count": len(filtered),
-                "message": f"Found {len(filtered)} transaction(s).",
-                "transactions": [format_transaction(txn) for txn in filtered]
-            }
+    Parameters:
+        date (Optional[str]): Only the version of this date's data (YYYY-MM-DD),
+            as reported by get_transaction_details for that date.
 
-        # IF NO EXACT MATCHES AND FUZZY SEARCH ENABLED
-        if fuzzy_search:
-            print(f"     No exact matches. Trying fuzzy search...")
-            
-            fuzzy_matches = []
-            
-            # Relaxed search: date + time + amount (ignore last4)
-            if date and time and amount:
-                user_time = datetime.strptime(time if len(time) == 8 else time + ":00", "%H:%M:%S")
-                
-                for txn in all_transactions:
-                    if txn.get('date') != date:
-                        continue
-                    
-                    # Check time (within 30 min)
-                    try:
-                        txn_time = datetime.strptime(txn.get('time', ''), "%H:%M:%S")
-                        time_diff = abs((txn_time - user_time).total_seconds())
-                        if time_diff > 1800:
-                            continue
-                    except:
-                        continue
-                    
-                    # Check amount (within ±50)
-                    if abs(txn.get('amount', 0) - amount) > 50:
-                        continue
-                    
-                    # This is a fuzzy match!
-                    fuzzy_matches.append(txn)
-                
-                if fuzzy_matches:
-                    fuzzy_matches = fuzzy_matches[:last_n]
-                    print(f"    Found {len(fuzzy_matches)} fuzzy match(es) (ignoring last4)\n")
-                    
-                    return {
-                        "success": True,
-                        "count": len(fuzzy_matches),
-                        "message": f"No exact match found, but found {len(fuzzy_matches)} transaction(s) with matching date, time, and amount. The last 4 digits might be different - please verify.",
-                        "transactions": [format_transaction(txn) for txn in fuzzy_matches],
-                        "warning": "Account number last 4 digits don't match. Please verify your account details."
-                    }
-
-        # NO MATCHES AT ALL
-        print(f"   No matches found\n")
-        
-        # Provide helpful debugging info
-        debug_info = []
-        if date:
-            date_matches = [t for t in all_transactions if t.get('date') == date]
-            debug_info.append(f"{len(date_matches)} transactions on {date}")
-        
+    Output:
+        {"dataset_version": <str>, "count": <int>, "loaded_at": <unix time>}
+    Cheap; clients use it to check whether cached lookups are still current.
+    """
+    snapshot = store.snapshot()
+    return {
+        "dataset_version": dataset_version(snapshot, date or None),
+        "count": len(snapshot),
+        "loaded_at": snapshot.loaded_at,
+    }
+
+
+def ingest_transactions(transactions: list[dict]):
+    """
+    Appends transactions to the store without reloading it.
+
+    Parameters:
+        transactions (list): Transaction dicts with the same fields as
+            transactions.json (txn_id, date, time, amount, sender_last4, ...).
+
+    Output:
+        {
+            "success": <bool>,
+            "count": <int> (rows applied),
+            "message": <str>,
+            "dataset_version": <str> (includes the new rows)
+        }
+    With UPI_INGEST_LOG set the rows are appended to that log first, so
+    they survive a restart; otherwise they are kept in memory only.
+    """
+    if len(transactions) > MAX_INGEST_ROWS:
         return {
             "success": False,
             "count": 0,
-            "message": "No transactions found matching the criteria.",
-            "transactions": [],
-            "debug_info": " | ".join(debug_info) if debug_info else "No transactions found in database for this date"
+            "message": f"Too many transactions: {len(transactions)} (max {MAX_INGEST_ROWS})",
         }
 
+    try:
+        if ingest_tailer is not None:
+            ingest_tailer.log.append(transactions)
+            ingest_tailer.poll()
+            count = len(transactions)
+        else:
+            count = store.ingest(transactions)
     except Exception as e:
-        print(f"Error in get_transaction_details: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Error in ingest_transactions: %s", e)
         return {
             "success": False,
             "count": 0,
-            "message": f"Database error: {str(e)}",
-            "transactions": []
+            "message": f"Ingestion error: {str(e)}",
         }
 
+    return {
+        "success": True,
+        "count": count,
+        "message": f"Ingested {count} transaction(s).",
+        "dataset_version": dataset_version(store.snapshot()),
+    }
+
+
+if INGEST_TOOL:
+    mcp.tool()(ingest_transactions)
+
+
+@mcp.custom_route("/stats", methods=["GET"])
+async def stats(request):
+    """Store size/version and result cache counters, as JSON"""
+    snapshot = store.snapshot()
+    return JSONResponse({
+        "store": {
+            "source": store.backend.describe(),
+            "count": len(snapshot),
+            "dataset_version": dataset_version(snapshot),
+            "loaded_at": snapshot.loaded_at,
+            # e.g. cached day partitions of a partitioned dataset
+            **({"backend": store.backend.stats()} if hasattr(store.backend, "stats") else {}),
+            "ingest": {**store.ingest_stats(), **(ingest_tailer.stats() if ingest_tailer else {})},
+        },
+        "result_cache": result_cache.stats(),
+    })
+
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def metrics(request):
+    """Per-stage latency histograms in the Prometheus text format"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 
 if __name__ == "__main__":
     print("="*60)
     print(" PAYMENT AGENT MCP SERVER (Enhanced with Fuzzy Matching)")
     print("="*60)
-    print(f" JSON File Path: {JSON_PATH}")
+    print(f" Data Source: {store.backend.describe()}")
     
-    if os.path.exists(JSON_PATH):
-        transactions = load_transactions()
-       
-    else:
-        print(f"  WARNING: {JSON_PATH} not found!")
-        print(f"   Please ensure transactions.json exists")
+    if not os.path.exists(DATA_PATH):
+        print(f"  WARNING: {DATA_PATH} not found!")
+        print(f"   Please run create_db.py first")
+
+    # Watch the source even if it is missing so it is picked up once created
+    store.start()
+    if ingest_tailer is not None:
+        print(f" Ingesting: {INGEST_LOG}")
+        ingest_tailer.start()
     
-    print(" Server starting on: http://localhost:8000/mcp")
+    print(f" Server starting on: http://localhost:{MCP_PORT}/mcp")
+    print(f" Stats: http://localhost:{MCP_PORT}/stats")
+    print(f" Metrics: http://localhost:{MCP_PORT}/metrics")
     print()
     
     mcp.run(transport="streamable-http")
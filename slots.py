@@ -0,0 +1,208 @@
+"""
+slots.py - Rule-based extraction of the four transaction details
+
+Pulls date / time / amount / last4 out of a user message with regular
+expressions, normalized exactly as the system prompt asks the LLM to:
+
+    "23/12/2024", "23 dec 2024", "yesterday"   -> "2024-12-23"
+    "6:18 pm", "06:18pm", "13:47", "10pm"      -> "18:18:00"
+    "₹2941.80", "561 rupees", "amount 561"     -> 2941.8
+    "last 4 digits 5907", "ending 5907"        -> "5907"
+
+Only unambiguous values are returned. Anything approximate ("afternoon",
+"around 2") or a date without a year is left to the LLM, which asks.
+Amounts are read before the last 4, so "account debited 2500 rupees" is an
+amount; digits that both patterns claim are left to the LLM as well.
+A bare number counts only when it answers the one detail the question just
+asked for (e.g. "2006" after "...last 4 digits of your account number?").
+"""
+
+import datetime
+import re
+
+SLOT_NAMES = ("date", "time", "amount", "sender_last4")
+
+_MONTHS = (
+    "january", "february", "march", "april", "may", "june", "july",
+    "august", "september", "october", "november", "december",
+)
+
+_NUMBER = r"\d{1,3}(?:,\d{2,3})+(?:\.\d{1,2})?|\d+(?:\.\d{1,2})?"
+
+_ISO_DATE = re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")
+_DMY_DATE = re.compile(r"\b(\d{1,2})[/.-](\d{1,2})[/.-](\d{4})\b")
+_DAY_MONTH = re.compile(
+    r"\b(\d{1,2})(?:st|nd|rd|th)?\s+(?:of\s+)?([a-z]{3,9})\.?(?:,?\s*(\d{4}))?\b"
+)
+_MONTH_DAY = re.compile(
+    r"\b([a-z]{3,9})\.?\s+(\d{1,2})(?:st|nd|rd|th)?(?:,?\s*(\d{4}))?\b"
+)
+_RELATIVE_DAYS = (("day before yesterday", 2), ("yesterday", 1), ("today", 0))
+
+_CLOCK_TIME = re.compile(r"\b(\d{1,2}):(\d{2})(?::(\d{2}))?(?:\s*([ap])\.?\s?m\b\.?)?")
+_HOUR_TIME = re.compile(r"\b(\d{1,2})\s*([ap])\.?\s?m\b\.?")
+
+_AMOUNT = re.compile(
+    rf"(?:₹|\brs\.?|\binr)\s*({_NUMBER})"
+    rf"|\b({_NUMBER})\s*(?:rupees|rs\b|inr\b|/-)"
+    rf"|\bamount\s*(?:of|is|was|=|:)?\s*(?:₹|rs\.?\s*|inr\s*)?({_NUMBER})"
+)
+_LAST4 = re.compile(
+    r"(?:last\s*(?:(?:4|four)\s*)?digits?|last\s*(?:4|four)|last4|ending(?:\s*(?:with|in))?"
+    r"|a/c(?:\s*no\.?)?)\D{0,25}?(\d{4})\b"
+    r"|[x*]{2,}(\d{4})\b"
+    # "account"/"card" alone is a weaker marker: "account was debited 2500
+    # rupees" names an amount, so the number must not read like one
+    r"|(?:account|card)(?:\s*(?:no\.?|number))?\D{0,25}?(\d{4})\b"
+    r"(?![.,]\d|\s*(?:₹|rupees|rs\b|inr\b|/-))"
+)
+_BARE_NUMBER = re.compile(rf"(?<![\d.])({_NUMBER})(?![\d.])")
+_BARE_LAST4 = re.compile(r"(?<!\d)(\d{4})(?!\d)")
+
+# Words that show the previous assistant question asked for a slot
+_QUESTIONS = (
+    ("date", ("date", "year", "which day", "what day")),
+    ("time", ("time",)),
+    ("amount", ("amount", "how much")),
+    ("sender_last4", ("last 4", "last four")),
+)
+
+
+def _month(token):
+    token = token.lower()
+    for number, name in enumerate(_MONTHS, 1):
+        if name.startswith(token) or (token == "sept" and number == 9):
+            return number
+    return None
+
+
+def _date(year, month, day):
+    try:
+        return datetime.date(int(year), int(month), int(day)).isoformat()
+    except (TypeError, ValueError):
+        return None
+
+
+def _blank(text, match):
+    """Remove a matched span so later patterns do not see it again"""
+    return text[:match.start()] + " " * (match.end() - match.start()) + text[match.end():]
+
+
+def _extract_date(text, today):
+    """(normalized date or None, text with the date removed)"""
+    for pattern, order in ((_ISO_DATE, "ymd"), (_DMY_DATE, "dmy")):
+        match = pattern.search(text)
+        if match:
+            parts = dict(zip(order, match.groups()))
+            return _date(parts["y"], parts["m"], parts["d"]), _blank(text, match)
+
+    for pattern, day_group, month_group in ((_DAY_MONTH, 1, 2), (_MONTH_DAY, 2, 1)):
+        for match in pattern.finditer(text):
+            month = _month(match.group(month_group))
+            if month is None:
+                continue
+            year = match.group(3)
+            # A date without a year is the LLM's to confirm
+            date = _date(year, month, match.group(day_group)) if year else None
+            return date, _blank(text, match)
+
+    for phrase, days_ago in _RELATIVE_DAYS:
+        index = text.find(phrase)
+        if index >= 0:
+            date = (today - datetime.timedelta(days=days_ago)).isoformat()
+            return date, text[:index] + " " * len(phrase) + text[index + len(phrase):]
+    return None, text
+
+
+def _extract_time(text):
+    match = _CLOCK_TIME.search(text)
+    if match:
+        hour, minute, second, meridiem = match.groups()
+    else:
+        match = _HOUR_TIME.search(text)
+        if not match:
+            return None, text
+        hour, meridiem = match.groups()
+        minute = second = None
+
+    hour, minute, second = int(hour), int(minute or 0), int(second or 0)
+    if meridiem:
+        if not 1 <= hour <= 12:
+            return None, _blank(text, match)
+        hour = hour % 12 + (12 if meridiem == "p" else 0)
+    if hour > 23 or minute > 59 or second > 59:
+        return None, _blank(text, match)
+    return f"{hour:02d}:{minute:02d}:{second:02d}", _blank(text, match)
+
+
+def _value_span(match):
+    """(text, span) of the first group that matched"""
+    group = next(index for index, value in enumerate(match.groups(), 1) if value)
+    return match.group(group), match.span(group)
+
+
+def _number(value):
+    return float(value.replace(",", ""))
+
+
+def expected_slot(question):
+    """
+    Slot the assistant's last message asked for, if it asked for exactly one.
+
+    "Which year, 2024 or 2025? And what was the amount?" asks for two, so a
+    bare "2024" in reply is not taken as the amount.
+    """
+    question = (question or "").lower()
+    asked = [name for name, keywords in _QUESTIONS if any(keyword in question for keyword in keywords)]
+    return asked[0] if len(asked) == 1 else None
+
+
+def extract_slots(text, expecting=None, today=None):
+    """
+    {slot: normalized value} for every slot found with confidence.
+
+    `expecting` is the slot the assistant just asked for (see expected_slot);
+    it lets a bare "2006" or "561.20" answer that question.
+    """
+    today = today or datetime.date.today()
+    text = (text or "").lower()
+    slots = {}
+
+    date, text = _extract_date(text, today)
+    if date:
+        slots["date"] = date
+
+    time, text = _extract_time(text)
+    if time:
+        slots["time"] = time
+
+    # Amounts with a currency or "amount" marker first, so their digits
+    # are never read as the last 4
+    match = _AMOUNT.search(text)
+    if match:
+        value, (start, end) = _value_span(match)
+        # Digits a last-4 marker also claims could be either: the LLM asks
+        claimed = any(
+            span[0] < end and start < span[1]
+            for span in (_value_span(found)[1] for found in _LAST4.finditer(text))
+        )
+        if not claimed and _number(value) > 0:
+            slots["amount"] = _number(value)
+        text = _blank(text, match)
+
+    match = _LAST4.search(text)
+    if match:
+        slots["sender_last4"] = _value_span(match)[0]
+        text = _blank(text, match)
+
+    # A single bare number answering the question just asked
+    if expecting == "sender_last4" and "sender_last4" not in slots:
+        found = _BARE_LAST4.findall(text)
+        if len(found) == 1:
+            slots["sender_last4"] = found[0]
+    elif expecting == "amount" and "amount" not in slots:
+        found = _BARE_NUMBER.findall(text)
+        if len(found) == 1 and _number(found[0]) > 0:
+            slots["amount"] = _number(found[0])
+
+    return slots
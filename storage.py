@@ -0,0 +1,390 @@
+"""
+storage.py - Storage backends for the transaction store
+JSON file (the original format), SQLite and memory-mapped snapshot files,
+behind one small interface:
+
+    backend.signature()              -> change token, compared on every poll
+    backend.load(version, signature) -> snapshot, or None if unreadable
+    backend.describe()               -> human readable source for logs
+
+Every snapshot answers len(), count_on(date) and search(...) the same way,
+so get_transaction_details does not care where the rows live.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from urllib.request import pathname2url
+
+from binary_snapshot import SNAPSHOT_EXTENSIONS, MappedSnapshot, write_binary_snapshot
+from instrumentation import get_logger, timed
+from transaction_store import (
+    AMOUNT_WINDOW,
+    TIME_WINDOW_SECONDS,
+    TRANSACTION_FIELDS,
+    MatchResult,
+    RANK_WEIGHTS,
+    TransactionSnapshot,
+    _AMOUNT_SLACK,
+    parse_seconds,
+)
+
+SQLITE_EXTENSIONS = (".db", ".sqlite", ".sqlite3")
+
+log = get_logger("storage")
+
+
+def file_signature(*paths):
+    """Cheap change token for files: (mtime_ns, size) each, None if all missing"""
+    signature = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            signature.append(None)
+            continue
+        signature.append((st.st_mtime_ns, st.st_size))
+    if not any(signature):
+        return None
+    return tuple(signature)
+
+
+# ==========================================
+# JSON BACKEND
+# ==========================================
+
+def iter_transactions_file(path):
+    """
+    Yield transactions from a JSON array file, or a JSON Lines file (*.jsonl).
+
+    JSON Lines is parsed one row at a time, so its rows never all exist as
+    dicts at once.
+    """
+    with open(path, 'r') as f:
+        if path.lower().endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from json.load(f)
+
+
+class JsonBackend:
+    """transactions.json (or .jsonl) loaded into compact columns and indexed"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def describe(self):
+        return self.path
+
+    def signature(self):
+        return file_signature(self.path)
+
+    def load(self, version, signature):
+        try:
+            return TransactionSnapshot(
+                iter_transactions_file(self.path), version=version, signature=signature
+            )
+        except FileNotFoundError:
+            log.error(" Error: %s not found", self.path)
+            return TransactionSnapshot([], version=version, signature=signature)
+        except json.JSONDecodeError as e:
+            log.error(" Error: Invalid JSON format - %s", e)
+            return None
+
+
+# ==========================================
+# SQLITE BACKEND
+# ==========================================
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    row_id INTEGER PRIMARY KEY,
+    txn_id TEXT,
+    date TEXT,
+    time TEXT,
+    seconds INTEGER,
+    amount REAL,
+    sender_last4 TEXT,
+    receiver_account_no TEXT,
+    receiver_bank_name TEXT,
+    sender_bank_name TEXT,
+    status TEXT,
+    description TEXT,
+    failure_reason TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_transactions_date_time ON transactions (date, seconds);
+CREATE INDEX IF NOT EXISTS idx_transactions_date_last4 ON transactions (date, sender_last4);
+CREATE INDEX IF NOT EXISTS idx_transactions_amount ON transactions (amount);
+"""
+
+_SELECT_FIELDS = ", ".join(TRANSACTION_FIELDS)
+
+
+class SqliteSnapshot:
+    """
+    One version of an SQLite database.
+
+    Nothing is loaded up front: each search is an indexed query, and every
+    thread gets its own read-only connection so several server workers (or
+    threads) can read concurrently.
+    """
+
+    def __init__(self, path, version=0, signature=None):
+        self.path = path
+        self.version = version
+        self.signature = signature
+        self.loaded_at = time.time()
+        self._local = threading.local()
+        self._count = self._connection().execute(
+            "SELECT count(*) FROM transactions"
+        ).fetchone()[0]
+
+    def __len__(self):
+        return self._count
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            uri = f"file:{pathname2url(os.path.abspath(self.path))}?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def count_on(self, date):
+        return self._connection().execute(
+            "SELECT count(*) FROM transactions WHERE date = ?", (date,)
+        ).fetchone()[0]
+
+    def search(self, date=None, sender_last4=None, seconds=None, amount=None, limit=None):
+        """Same contract as TransactionIndex.search, answered by SQLite"""
+        clauses, params = [], []
+        if date is not None:
+            clauses.append("date = ?")
+            params.append(date)
+        if sender_last4 is not None:
+            clauses.append("sender_last4 = ?")
+            params.append(sender_last4)
+        if seconds is not None:
+            clauses.append("seconds BETWEEN ? AND ?")
+            params += [seconds - TIME_WINDOW_SECONDS, seconds + TIME_WINDOW_SECONDS]
+        if amount is not None:
+            # BETWEEN lets SQLite use the index, abs() keeps the exact ±50 rule
+            clauses.append("amount BETWEEN ? AND ? AND abs(amount - ?) <= ?")
+            params += [
+                amount - AMOUNT_WINDOW - _AMOUNT_SLACK,
+                amount + AMOUNT_WINDOW + _AMOUNT_SLACK,
+                amount,
+                AMOUNT_WINDOW,
+            ]
+
+        sql = f"SELECT {_SELECT_FIELDS} FROM transactions"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY row_id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        return [dict(row) for row in self._connection().execute(sql, params)]
+
+    def rank(self, date=None, filters=None, limit=10):
+        """Same contract as TransactionIndex.rank; SQLite keeps only the top `limit`"""
+        filters = filters or {}
+        if limit is None or limit <= 0:
+            return []
+
+        terms, clauses, params = ["0.0"], [], []
+        if filters.get("seconds") is not None:
+            terms.append(f"? * abs(seconds - ?) / {float(TIME_WINDOW_SECONDS)}")
+            params += [RANK_WEIGHTS["time"], filters["seconds"]]
+            clauses.append("seconds IS NOT NULL")
+        if filters.get("amount") is not None:
+            terms.append(f"? * abs(amount - ?) / {float(AMOUNT_WINDOW)}")
+            params += [RANK_WEIGHTS["amount"], filters["amount"]]
+            clauses.append("amount IS NOT NULL")
+        if filters.get("sender_last4") is not None:
+            terms.append("? * (sender_last4 IS NOT ?)")
+            params += [RANK_WEIGHTS["last4"], filters["sender_last4"]]
+        if date is not None:
+            clauses.append("date = ?")
+            params.append(date)
+
+        sql = f"SELECT {_SELECT_FIELDS}, {' + '.join(terms)} AS score FROM transactions"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY score, row_id LIMIT ?"
+        params.append(limit)
+
+        ranked = []
+        for row in self._connection().execute(sql, params):
+            txn = dict(row)
+            ranked.append((txn.pop("score"), txn))
+        return ranked
+
+    def match(self, date=None, exact=None, fallback=None, limit=None):
+        """Same contract as TransactionIndex.match; fallback is queried only on a miss"""
+        with timed("sqlite.exact"):
+            result = MatchResult(exact=self.search(date=date, limit=limit, **(exact or {})))
+        if not result.exact and fallback is not None:
+            with timed("sqlite.fuzzy"):
+                result.fallback = self.search(date=date, limit=limit, **fallback)
+        if not result.exact and not result.fallback:
+            result.date_count = self.count_on(date) if date is not None else len(self)
+        return result
+
+
+class SqliteBackend:
+    """transactions.db built by `python create_db.py --migrate`"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def describe(self):
+        return self.path
+
+    def signature(self):
+        # A WAL-mode writer touches the -wal file, not the main file
+        return file_signature(self.path, self.path + "-wal")
+
+    def load(self, version, signature):
+        if not os.path.exists(self.path):
+            log.error(" Error: %s not found", self.path)
+            return TransactionSnapshot([], version=version, signature=signature)
+        try:
+            return SqliteSnapshot(self.path, version=version, signature=signature)
+        except sqlite3.DatabaseError as e:
+            log.error(" Error: Unreadable database - %s", e)
+            return None
+
+
+class BinaryBackend:
+    """transactions.snap built by `python create_db.py --format binary`, memory-mapped"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def describe(self):
+        return self.path
+
+    def signature(self):
+        return file_signature(self.path)
+
+    def load(self, version, signature):
+        try:
+            return MappedSnapshot(self.path, version=version, signature=signature)
+        except FileNotFoundError:
+            log.error(" Error: %s not found", self.path)
+            return TransactionSnapshot([], version=version, signature=signature)
+        except (ValueError, KeyError) as e:
+            log.error(" Error: Unreadable snapshot file - %s", e)
+            return None
+
+
+def open_backend(path, kind=None):
+    """
+    Backend for a data file or partition directory; `kind` is 'json',
+    'sqlite', 'binary' or 'partitioned', else by extension (a directory is
+    partitioned)
+    """
+    if kind is None:
+        if os.path.isdir(path):
+            kind = "partitioned"
+        elif path.lower().endswith(SQLITE_EXTENSIONS):
+            kind = "sqlite"
+        elif path.lower().endswith(SNAPSHOT_EXTENSIONS):
+            kind = "binary"
+        else:
+            kind = "json"
+    if kind == "sqlite":
+        return SqliteBackend(path)
+    if kind == "binary":
+        return BinaryBackend(path)
+    if kind == "partitioned":
+        # partitions.py builds on this module
+        from partitions import PartitionedBackend
+        return PartitionedBackend(path)
+    if kind == "json":
+        return JsonBackend(path)
+    raise ValueError(f"Unknown storage backend: {kind}")
+
+
+# ==========================================
+# MIGRATION
+# ==========================================
+
+def _sqlite_row(row_id, txn):
+    amount = txn.get("amount")
+    return (
+        row_id,
+        txn.get("txn_id"),
+        txn.get("date"),
+        txn.get("time"),
+        parse_seconds(txn.get("time")),
+        amount if isinstance(amount, (int, float)) else None,
+        txn.get("sender_last4"),
+        txn.get("receiver_account_no"),
+        txn.get("receiver_bank_name"),
+        txn.get("sender_bank_name"),
+        txn.get("status"),
+        txn.get("description"),
+        txn.get("failure_reason"),
+    )
+
+
+def write_sqlite(transactions, db_path, batch_size=10000):
+    """
+    Write transactions (any iterable of dicts) into a fresh SQLite database.
+
+    The database is built next to the target and moved into place at the
+    end, so running servers only ever see a complete file.
+    """
+    tmp_path = db_path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript(SQLITE_SCHEMA)
+        insert = f"INSERT INTO transactions VALUES ({', '.join('?' * 13)})"
+        batch, count = [], 0
+        for row_id, txn in enumerate(transactions):
+            batch.append(_sqlite_row(row_id, txn))
+            if len(batch) >= batch_size:
+                conn.executemany(insert, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            conn.executemany(insert, batch)
+            count += len(batch)
+        conn.commit()
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+
+    os.replace(tmp_path, db_path)
+    return count
+
+
+def migrate_json_to_binary(json_path, snapshot_path):
+    """Turn transactions.json into a memory-mappable snapshot file"""
+    try:
+        count = write_binary_snapshot(iter_transactions_file(json_path), snapshot_path)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"{json_path} is not valid JSON: {str(e)}") from e
+    print(f" {count} transactions migrated from {json_path} to {snapshot_path}")
+    return count
+
+
+def migrate_json_to_sqlite(json_path, db_path):
+    """Turn transactions.json into an indexed SQLite database"""
+    try:
+        count = write_sqlite(iter_transactions_file(json_path), db_path)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"{json_path} is not valid JSON: {str(e)}") from e
+    print(f" {count} transactions migrated from {json_path} to {db_path}")
+    return count
@@ -0,0 +1,203 @@
+"""
+stub_llm.py - Local OpenAI-compatible chat server for load tests
+
+Answers POST /v1/chat/completions with a scripted AgentDecision after a
+configurable delay, so the agent can be driven without a real model:
+
+    details missing     output, asking for whatever is still missing
+    all four known      get_transaction_details with them
+    tool result given   output, summarising the result
+
+The decision comes back in the shape the client asked for: a tool call
+when the request carries `tools` (function calling), JSON message content
+otherwise (json_schema / json_object response formats).
+
+    python stub_llm.py --port 8100 --latency 0.2
+    ChatOpenAI(base_url="http://127.0.0.1:8100/v1", api_key="stub", model="stub")
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_COLLECTED = re.compile(r"\b(date|time|amount|last4)=([^,\n]+)")
+_DATE = re.compile(r"\b(\d{4}-\d{2}-\d{2})\b")
+_TIME = re.compile(r"\b(\d{1,2}:\d{2}(?::\d{2})?)\b")
+_AMOUNT = re.compile(r"(?:₹|\brs\.?\s*|\bamount\s*)(\d+(?:\.\d{1,2})?)", re.IGNORECASE)
+_LAST4 = re.compile(r"\blast\s*(?:4|four)\D{0,20}(\d{4})\b|^\s*(\d{4})\s*$", re.IGNORECASE)
+
+_QUESTIONS = {
+    "date": "the date of the transaction (with the year)",
+    "time": "the time of the transaction",
+    "amount": "the amount",
+    "sender_last4": "the last 4 digits of your account number",
+}
+
+
+def _section(prompt, start, end):
+    head, _, rest = prompt.partition(start)
+    return rest.partition(end)[0] if rest else ""
+
+
+def decide(prompt):
+    """Scripted AgentDecision (as a dict) for the rendered decision prompt"""
+    history = _section(prompt, "Conversation history:", "User message:")
+    user = _section(prompt, "User message:", "Decide the NEXT ACTION").strip()
+
+    if user.startswith("{") and "transactions" in user:
+        try:
+            result = json.loads(user)
+        except ValueError:
+            result = {}
+        return {
+            "thought": "Summarising the tool result.",
+            "action": "output",
+            "action_input": {"message": result.get("message", "Here is what I found.")},
+        }
+
+    details = {}
+    for name, value in _COLLECTED.findall(history):
+        details["sender_last4" if name == "last4" else name] = value.strip()
+    # Details the agent already normalised win over the raw message
+    for name, pattern in (("date", _DATE), ("time", _TIME), ("amount", _AMOUNT)):
+        match = pattern.search(user)
+        if match:
+            details.setdefault(name, match.group(1))
+    match = _LAST4.search(user)
+    if match:
+        details.setdefault("sender_last4", match.group(1) or match.group(2))
+
+    missing = [name for name in _QUESTIONS if name not in details]
+    if missing:
+        asks = " and ".join(_QUESTIONS[name] for name in missing)
+        return {
+            "thought": f"Still missing: {', '.join(missing)}.",
+            "action": "output",
+            "action_input": {"message": f"Please share {asks}."},
+        }
+
+    time_value = details["time"]
+    if len(time_value) == 5:
+        time_value += ":00"
+    return {
+        "thought": "All four details are known.",
+        "action": "get_transaction_details",
+        "action_input": {
+            "date": details["date"],
+            "time": time_value,
+            "amount": float(details["amount"]),
+            "sender_last4": details["sender_last4"],
+            "last_n": 10,
+        },
+    }
+
+
+def _prompt_text(messages):
+    parts = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list):
+            content = "".join(part.get("text", "") for part in content if isinstance(part, dict))
+        parts.append(content or "")
+    return "\n".join(parts)
+
+
+def completion(request, decision):
+    """OpenAI chat.completion body carrying `decision`"""
+    arguments = json.dumps(decision)
+    tools = request.get("tools") or []
+    if tools:
+        name = tools[0].get("function", {}).get("name", "AgentDecision")
+        message = {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [{
+                "id": f"call_{uuid.uuid4().hex[:24]}",
+                "type": "function",
+                "function": {"name": name, "arguments": arguments},
+            }],
+        }
+        finish_reason = "tool_calls"
+    else:
+        message = {"role": "assistant", "content": arguments}
+        finish_reason = "stop"
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request.get("model", "stub"),
+        "choices": [{"index": 0, "message": message, "logprobs": None,
+                     "finish_reason": finish_reason}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+class StubLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, jitter=0.0):
+        super().__init__(address, _Handler)
+        self.latency = latency
+        self.jitter = jitter
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def count(self):
+        with self._lock:
+            self.requests += 1
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        self.server.count()
+
+        delay = self.server.latency + random.uniform(0, self.server.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+        decision = decide(_prompt_text(request.get("messages", [])))
+        body = json.dumps(completion(request, decision)).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_llm(port=0, latency=0.0, jitter=0.0, host="127.0.0.1"):
+    """StubLLMServer serving from a daemon thread (port 0 picks a free one)"""
+    server = StubLLMServer((host, port), latency, jitter)
+    threading.Thread(target=server.serve_forever, name="stub-llm", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scripted OpenAI-compatible LLM for load tests")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds added to every completion")
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="extra random delay, uniform in [0, jitter] seconds")
+    args = parser.parse_args()
+
+    server = StubLLMServer(("127.0.0.1", args.port), args.latency, args.jitter)
+    print(f" Stub LLM on {server.base_url} (latency {args.latency}s + up to {args.jitter}s)")
+    server.serve_forever()
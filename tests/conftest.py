@@ -0,0 +1,15 @@
+import importlib.machinery
+import importlib.util
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Server modules import each other flat ("from storage import ...")
+sys.path.insert(0, str(ROOT))
+
+# Agent modules import each other as upi_agent.*, whatever the checkout is called
+if importlib.util.find_spec("upi_agent") is None:
+    spec = importlib.machinery.ModuleSpec("upi_agent", None, is_package=True)
+    spec.submodule_search_locations = [str(ROOT)]
+    sys.modules["upi_agent"] = importlib.util.module_from_spec(spec)
@@ -0,0 +1,75 @@
+import asyncio
+import socket
+import threading
+import time
+
+import pytest
+import uvicorn
+from mcp.server.fastmcp import FastMCP
+
+from upi_agent.mcp_tools import MCPSession
+
+
+@pytest.fixture(scope="module")
+def server_url():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    mcp = FastMCP("test")
+
+    @mcp.tool()
+    async def slow(seconds: float = 2.0) -> str:
+        await asyncio.sleep(seconds)
+        return "done"
+
+    @mcp.tool()
+    def ping() -> str:
+        return "pong"
+
+    server = uvicorn.Server(uvicorn.Config(mcp.streamable_http_app(), port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    yield f"http://127.0.0.1:{port}/mcp"
+    server.should_exit = True
+    thread.join(5)
+
+
+@pytest.fixture
+def session(server_url):
+    session = MCPSession(connections={"payment": {"url": server_url, "transport": "http"}}, timeout=0.5)
+    opened = []
+    reopen = session._reopen
+
+    async def counted_reopen():
+        opened.append(time.perf_counter())
+        await reopen()
+
+    session._reopen = counted_reopen
+    session.opened = opened
+    yield session
+    session.close()
+
+
+def test_timeout_does_not_reopen_the_session(session):
+    session.tools()
+    runner = session._runner
+    with pytest.raises(TimeoutError):
+        session.call("slow", {"seconds": 2.0})
+    assert session._runner is runner and len(session.opened) == 1
+    assert "pong" in str(session.call("ping", {}))
+
+
+def test_async_timeout_does_not_reopen_the_session(session):
+    async def run():
+        await session.acall("ping", {})
+        runner = session._runner
+        with pytest.raises(asyncio.TimeoutError):
+            await session.acall("slow", {"seconds": 2.0})
+        assert session._runner is runner
+        return await session.acall("ping", {})
+
+    assert "pong" in str(asyncio.run(run()))
+    assert len(session.opened) == 1
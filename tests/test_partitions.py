@@ -0,0 +1,41 @@
+import datetime
+import os
+
+from partitions import PartitionCache, PartitionedBackend, write_partitions
+
+DAYS = [(datetime.date(2024, 12, 1) + datetime.timedelta(days=n)).isoformat() for n in range(20)]
+
+
+def _open(tmp_path, cache):
+    rows = [
+        {"txn_id": f"TXN{n}", "date": date, "time": "10:00:00", "amount": 100.0 + n, "sender_last4": "5907"}
+        for n, date in enumerate(DAYS)
+    ]
+    write_partitions(rows, str(tmp_path), file_format="jsonl")
+    return PartitionedBackend(str(tmp_path), cache).load(version=1, signature=None)
+
+
+def test_dateless_scan_keeps_hot_partitions_cached(tmp_path):
+    cache = PartitionCache(4)
+    snapshot = _open(tmp_path, cache)
+    hot = DAYS[-1]
+    assert len(snapshot.match(hot, {"sender_last4": "5907"}).exact) == 1
+    assert cache.loads == 1
+
+    assert len(snapshot.match(None, {"sender_last4": "5907"}).exact) == len(DAYS)
+    assert len(snapshot.rank(None, {"amount": 110.0}, limit=3)) == 3
+    assert (cache.loads, cache.evictions) == (1, 0)
+
+    hits = cache.hits
+    snapshot.match(hot, {"sender_last4": "5907"})
+    assert (cache.loads, cache.hits) == (1, hits + 1)
+
+
+def test_missing_day_file_is_read_once_it_exists(tmp_path):
+    snapshot = _open(tmp_path, PartitionCache(4))
+    path = os.path.join(tmp_path, DAYS[0] + ".jsonl")
+    os.replace(path, path + ".away")
+    assert snapshot.match(DAYS[0], {}).exact == []
+
+    os.replace(path + ".away", path)
+    assert [row.get("txn_id") for row in snapshot.match(DAYS[0], {}).exact] == ["TXN0"]
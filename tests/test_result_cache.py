@@ -0,0 +1,39 @@
+import pytest
+
+import server
+from result_cache import ResultCache
+from transaction_store import TransactionSnapshot
+
+ROWS = [
+    {"txn_id": "TXN1", "date": "2024-12-23", "time": "00:10:00", "amount": 30.0, "sender_last4": "1234"},
+    {"txn_id": "TXN2", "date": "2024-12-23", "time": "18:18:05", "amount": 2941.8, "sender_last4": "5907"},
+]
+
+# Pairs the exact search treats alike but the fuzzy pass does not
+QUERIES = [
+    {"time": None, "amount": 30.0},
+    {"time": "00:00:00", "amount": 30.0},
+    {"time": "00:00", "amount": 30.0},
+    {"time": "00:20:00", "amount": None},
+    {"time": "00:20:00", "amount": -10.0},
+    {"time": "00:20:00", "amount": 0.0},
+    {"time": "18:18", "amount": 2941.8},
+    {"time": "18:18:00", "amount": 2941.8},
+]
+
+
+@pytest.fixture
+def snapshot(monkeypatch):
+    monkeypatch.setattr(server, "result_cache", ResultCache())
+    return TransactionSnapshot(ROWS, version=1, signature="test")
+
+
+def test_cached_results_match_fresh_searches(snapshot):
+    for _ in range(2):  # second round is served from the cache
+        for query in QUERIES:
+            query = {"date": "2024-12-23", "sender_last4": "9999", "last_n": 10,
+                     "fuzzy_search": True, "ranked": False, **query}
+            cached = server.cached_search(snapshot, query)
+            fresh = server.search_transactions(snapshot, **query)
+            assert {k: v for k, v in cached.items() if k != "dataset_version"} == fresh, query
+    assert server.result_cache.hits > 0
@@ -0,0 +1,43 @@
+import datetime
+
+from slots import expected_slot, extract_slots
+
+TODAY = datetime.date(2024, 12, 24)
+
+
+def test_amount_with_currency_is_not_read_as_last4():
+    slots = extract_slots("My account was debited 2500 rupees on 23/12/2024 at 6:18 pm", today=TODAY)
+    assert slots == {"date": "2024-12-23", "time": "18:18:00", "amount": 2500.0}
+
+
+def test_decimal_amount_after_account_keeps_its_integer_part():
+    slots = extract_slots(
+        "money deducted from my account 2941.80 rs on 23/12/2024 at 6:18 pm, last 4 digits 5907",
+        today=TODAY,
+    )
+    assert slots == {"date": "2024-12-23", "time": "18:18:00", "amount": 2941.8, "sender_last4": "5907"}
+
+
+def test_account_number_without_currency_is_last4():
+    assert extract_slots("paid from account number 5907, amount 561") == {
+        "sender_last4": "5907", "amount": 561.0,
+    }
+    assert extract_slots("a/c xx5907 rs 561") == {"sender_last4": "5907", "amount": 561.0}
+
+
+def test_digits_claimed_by_both_patterns_are_left_to_the_llm():
+    assert extract_slots("ending 2500 rupees") == {}
+
+
+def test_bare_number_answers_a_single_question():
+    assert expected_slot("Could you please provide the transaction amount?") == "amount"
+    assert extract_slots("561.20", expected_slot("What was the amount?")) == {"amount": 561.2}
+    question = "Could you please provide the last 4 digits of your account number?"
+    assert extract_slots("2006", expected_slot(question)) == {"sender_last4": "2006"}
+
+
+def test_bare_number_is_ignored_when_several_details_were_asked():
+    question = "Which year, 2024 or 2025? And what was the amount?"
+    assert expected_slot(question) is None
+    assert extract_slots("2024", expected_slot(question)) == {}
+    assert expected_slot("Please share date, time, amount and last 4 digits.") is None
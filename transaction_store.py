@@ -0,0 +1,1046 @@
+"""
+transaction_store.py - Long-lived transaction store for the MCP server
+Loads transactions once, watches the storage backend and swaps in a fresh
+snapshot in the background whenever the data changes. Rows appended
+with ingest() (see ingest.py) are indexed on their own and layered on top.
+"""
+
+import heapq
+import math
+import os
+import threading
+import time
+import uuid
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date as date_type, datetime
+from itertools import chain
+
+from instrumentation import get_logger, observe, timed
+
+try:
+    import numpy as np
+except ImportError:  # optional: vectorised query path
+    np = None
+
+# "auto" evaluates large candidate sets with NumPy when it is installed,
+# "python" / "numpy" force one engine. Both return identical results.
+QUERY_ENGINE = os.environ.get("UPI_QUERY_ENGINE", "auto")
+NUMPY_MIN_CANDIDATES = 256
+
+if QUERY_ENGINE == "numpy" and np is None:
+    raise ImportError("UPI_QUERY_ENGINE=numpy requires numpy to be installed")
+
+TIME_WINDOW_SECONDS = 1800  # ±30 minutes
+AMOUNT_WINDOW = 50          # ±50 rupees
+
+# Widening applied to the amount range scan so float rounding at the window
+# edges can never drop a row; every candidate is re-checked exactly.
+_AMOUNT_SLACK = 1e-6
+
+# Ranked search: one unit of distance = 30 min off, ₹50 off, or a
+# different last4.
+RANK_WEIGHTS = {"time": 1.0, "amount": 1.0, "last4": 1.0}
+
+log = get_logger("store")
+
+
+def _use_numpy(candidate_count):
+    if np is None or QUERY_ENGINE == "python" or candidate_count == 0:
+        return False
+    return QUERY_ENGINE == "numpy" or candidate_count >= NUMPY_MIN_CANDIDATES
+
+
+def parse_seconds(value):
+    """'HH:MM:SS' -> seconds since midnight, or None if it is not a valid time"""
+    if not isinstance(value, str):
+        return None
+    if len(value) == 8 and value[2] == ':' and value[5] == ':':
+        hh, mm, ss = value[0:2], value[3:5], value[6:8]
+        if hh.isdigit() and mm.isdigit() and ss.isdigit():
+            h, m, s = int(hh), int(mm), int(ss)
+            if h < 24 and m < 60 and s < 60:
+                return h * 3600 + m * 60 + s
+            return None
+    try:
+        t = datetime.strptime(value, "%H:%M:%S")
+    except ValueError:
+        return None
+    return t.hour * 3600 + t.minute * 60 + t.second
+
+
+# ==========================================
+# COLUMNAR STORAGE
+# ==========================================
+
+TRANSACTION_FIELDS = (
+    "txn_id",
+    "date",
+    "time",
+    "amount",
+    "sender_last4",
+    "receiver_account_no",
+    "receiver_bank_name",
+    "sender_bank_name",
+    "status",
+    "description",
+    "failure_reason",
+)
+
+_CATEGORY_FIELDS = (
+    "sender_last4",
+    "receiver_bank_name",
+    "sender_bank_name",
+    "status",
+    "description",
+    "failure_reason",
+)
+
+_MISSING = object()
+
+
+class TransactionRow:
+    """
+    Lightweight view of one stored transaction.
+
+    Only built for rows that are actually returned, and supports .get() so
+    it can be formatted exactly like the original dicts.
+    """
+
+    __slots__ = TRANSACTION_FIELDS
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in TRANSACTION_FIELDS}
+
+
+class _StringColumn:
+    """Distinct strings packed into one UTF-8 buffer plus offsets"""
+
+    __slots__ = ("_data", "_offsets")
+
+    def __init__(self):
+        self._data = bytearray()
+        self._offsets = array('q', [0])
+
+    def append(self, value):
+        self._data += value.encode()
+        self._offsets.append(len(self._data))
+
+    def __getitem__(self, row):
+        return self._data[self._offsets[row]:self._offsets[row + 1]].decode()
+
+    def nbytes(self):
+        return len(self._data) + self._offsets.itemsize * len(self._offsets)
+
+
+class _DictColumn:
+    """Low-cardinality values stored once, rows hold integer codes"""
+
+    __slots__ = ("values", "codes", "_lookup")
+
+    def __init__(self):
+        self.values = []
+        self.codes = array('i')
+        self._lookup = {}
+
+    def encode(self, value):
+        code = self._lookup.get(value)
+        if code is None:
+            code = len(self.values)
+            self.values.append(value)
+            self._lookup[value] = code
+        return code
+
+    def append(self, value):
+        self.codes.append(self.encode(value))
+
+    def code_of(self, value):
+        return self._lookup.get(value)
+
+    def __getitem__(self, row):
+        return self.values[self.codes[row]]
+
+    def nbytes(self):
+        return self.codes.itemsize * len(self.codes)
+
+
+class TransactionColumns:
+    """
+    Array-backed, column-per-field storage for transactions.
+
+    - date as a day ordinal, time as seconds since midnight (array('i'))
+    - amount as array('d')
+    - last4, bank names, status, description, failure reason dictionary-encoded
+    - txn_id and receiver account packed into UTF-8 buffers
+
+    Values that do not survive this encoding unchanged (missing or
+    non-canonical dates/times, non-numeric amounts, non-string ids) are kept
+    verbatim in a small per-row overflow map, so formatting stays exact.
+    """
+
+    def __init__(self, transactions=()):
+        self.date_ordinals = array('i')
+        self.seconds = array('i')
+        self.amounts = array('d')
+        self.txn_ids = _StringColumn()
+        self.receiver_accounts = _StringColumn()
+        self.categories = {field: _DictColumn() for field in _CATEGORY_FIELDS}
+        self.overflow = {}
+        self._date_strings = {}
+        self._numpy = None
+        self._count = 0
+        for txn in transactions:
+            self.append(txn)
+
+    def __len__(self):
+        return self._count
+
+    def append(self, txn):
+        """Encode one transaction dict; returns its row id"""
+        row = self._count
+        overflow = {}
+
+        date = txn.get('date')
+        ordinal = _date_ordinal(date)
+        if ordinal < 0:
+            overflow['date'] = date
+        self.date_ordinals.append(ordinal)
+
+        time_value = txn.get('time')
+        seconds = parse_seconds(time_value)
+        if seconds is None:
+            seconds = -1
+        if seconds < 0 or _format_seconds(seconds) != time_value:
+            overflow['time'] = time_value
+        self.seconds.append(seconds)
+
+        amount = txn.get('amount', _MISSING)
+        if amount is _MISSING:
+            # Same as txn.get("amount", 0) when filtering, None when formatting
+            self.amounts.append(0.0)
+            overflow['amount'] = None
+        elif isinstance(amount, (int, float)) and not isinstance(amount, bool):
+            self.amounts.append(amount)
+        else:
+            self.amounts.append(math.nan)
+            overflow['amount'] = amount
+
+        for field, column in (('txn_id', self.txn_ids),
+                              ('receiver_account_no', self.receiver_accounts)):
+            value = txn.get(field)
+            if isinstance(value, str):
+                column.append(value)
+            else:
+                column.append("")
+                overflow[field] = value
+
+        for field, column in self.categories.items():
+            value = txn.get(field)
+            try:
+                column.append(value)
+            except TypeError:  # unhashable
+                column.append(None)
+                overflow[field] = value
+
+        if overflow:
+            self.overflow[row] = overflow
+        self._count += 1
+        return row
+
+    def date_string(self, row):
+        ordinal = self.date_ordinals[row]
+        text = self._date_strings.get(ordinal)
+        if text is None:
+            text = date_type.fromordinal(ordinal).isoformat()
+            self._date_strings[ordinal] = text
+        return text
+
+    def row(self, row):
+        """Materialise a TransactionRow view for one row id"""
+        view = TransactionRow()
+        overflow = self.overflow.get(row, {})
+        view.txn_id = overflow['txn_id'] if 'txn_id' in overflow else self.txn_ids[row]
+        view.date = overflow['date'] if 'date' in overflow else self.date_string(row)
+        view.time = overflow['time'] if 'time' in overflow else _format_seconds(self.seconds[row])
+        view.amount = overflow['amount'] if 'amount' in overflow else self.amounts[row]
+        view.receiver_account_no = (
+            overflow['receiver_account_no'] if 'receiver_account_no' in overflow
+            else self.receiver_accounts[row]
+        )
+        for field, column in self.categories.items():
+            setattr(view, field, overflow[field] if field in overflow else column[row])
+        return view
+
+    def row_dict(self, row):
+        """A row as a dict that encodes back to exactly the same columns"""
+        txn = self.row(row).to_dict()
+        overflow = self.overflow.get(row)
+        if overflow and overflow.get('amount', _MISSING) is None and self.amounts[row] == 0.0:
+            del txn['amount']  # the field was missing, not null
+        return txn
+
+    def row_date(self, row):
+        """Raw date value of a row, as used for the date index"""
+        overflow = self.overflow.get(row)
+        if overflow and 'date' in overflow:
+            return overflow['date']
+        return self.date_string(row)
+
+    def numpy_views(self):
+        """Zero-copy NumPy views of the columns the filters read"""
+        if self._numpy is None:
+            self._numpy = {
+                "seconds": np.frombuffer(self.seconds, dtype=np.int32),
+                "amounts": np.frombuffer(self.amounts, dtype=np.float64),
+                "last4": np.frombuffer(self.categories['sender_last4'].codes, dtype=np.int32),
+            }
+        return self._numpy
+
+    def nbytes(self):
+        """Approximate bytes held by the column buffers"""
+        total = sum(
+            a.itemsize * len(a)
+            for a in (self.date_ordinals, self.seconds, self.amounts)
+        )
+        total += self.txn_ids.nbytes() + self.receiver_accounts.nbytes()
+        total += sum(column.nbytes() for column in self.categories.values())
+        return total
+
+
+def _date_ordinal(value):
+    """Day ordinal of a canonical 'YYYY-MM-DD' string, -1 otherwise"""
+    if not isinstance(value, str) or len(value) != 10:
+        return -1
+    try:
+        parsed = date_type.fromisoformat(value)
+    except ValueError:
+        return -1
+    return parsed.toordinal() if parsed.isoformat() == value else -1
+
+
+def _format_seconds(seconds):
+    return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+# ==========================================
+# INDEXES
+# ==========================================
+
+class _DateIndex:
+    """
+    All row ids of one date, plus the same rows sorted by time, by amount
+    and by sender_last4 code, so each filter is a bisect range.
+    """
+
+    __slots__ = (
+        "rows",
+        "seconds", "seconds_rows",
+        "amounts", "amount_rows",
+        "last4_codes", "last4_rows",
+    )
+
+    def __init__(self, rows, columns):
+        self.rows = rows
+
+        row_seconds = columns.seconds
+        by_time = sorted((r for r in rows if row_seconds[r] >= 0), key=row_seconds.__getitem__)
+        self.seconds = array('i', (row_seconds[r] for r in by_time))
+        self.seconds_rows = array('i', by_time)
+
+        row_amounts = columns.amounts
+        by_amount = sorted((r for r in rows if row_amounts[r] == row_amounts[r]),  # skip NaN
+                           key=row_amounts.__getitem__)
+        self.amounts = array('d', (row_amounts[r] for r in by_amount))
+        self.amount_rows = array('i', by_amount)
+
+        # stable sort: rows sharing a last4 stay in file order
+        last4 = columns.categories['sender_last4'].codes
+        by_last4 = sorted(rows, key=last4.__getitem__)
+        self.last4_codes = array('i', (last4[r] for r in by_last4))
+        self.last4_rows = array('i', by_last4)
+
+    def time_range(self, seconds):
+        lo = bisect_left(self.seconds, seconds - TIME_WINDOW_SECONDS)
+        hi = bisect_right(self.seconds, seconds + TIME_WINDOW_SECONDS)
+        return self.seconds_rows[lo:hi]
+
+    def amount_range(self, amount):
+        lo = bisect_left(self.amounts, amount - AMOUNT_WINDOW - _AMOUNT_SLACK)
+        hi = bisect_right(self.amounts, amount + AMOUNT_WINDOW + _AMOUNT_SLACK)
+        return self.amount_rows[lo:hi]
+
+    def last4_range(self, code):
+        lo = bisect_left(self.last4_codes, code)
+        hi = bisect_right(self.last4_codes, code)
+        return self.last4_rows[lo:hi]
+
+    def nbytes(self):
+        return sum(
+            getattr(self, name).itemsize * len(getattr(self, name))
+            for name in self.__slots__
+        )
+
+
+class MatchResult:
+    """Outcome of TransactionIndex.match: rows plus diagnostic counts"""
+
+    __slots__ = ("exact", "fallback", "date_count", "candidates")
+
+    def __init__(self, exact=None, fallback=None, date_count=0, candidates=0):
+        self.exact = exact or []
+        self.fallback = fallback or []
+        self.date_count = date_count    # rows on the requested date
+        self.candidates = candidates    # rows actually examined
+
+
+class TransactionIndex:
+    """
+    Secondary indexes over TransactionColumns.
+
+    - hash index on date, then per-date arrays sorted by sender_last4,
+      seconds-since-midnight and amount, so (date, sender_last4) lookups
+      and the ±30 min / ±50 windows are bisect range scans
+
+    A search starts from whichever index yields the fewest candidates and
+    re-checks the remaining filters on those rows only, so its cost follows
+    the number of matches rather than the size of the table.
+    """
+
+    def __init__(self, columns, by_date=None):
+        self.columns = columns
+        if by_date is not None:
+            # Prebuilt, e.g. mapped from a snapshot file
+            self.by_date = by_date
+            return
+
+        by_date = {}
+        for row in range(len(columns)):
+            date = columns.row_date(row)
+            rows = by_date.get(date)
+            if rows is None:
+                rows = by_date[date] = array('i')
+            rows.append(row)
+
+        self.by_date = {date: _DateIndex(rows, columns) for date, rows in by_date.items()}
+
+    def count_on(self, date):
+        """Number of transactions on a date"""
+        index = self.by_date.get(date)
+        return len(index.rows) if index else 0
+
+    def search(self, date=None, sender_last4=None, seconds=None, amount=None, limit=None):
+        """
+        Transactions matching every given filter, in file order.
+
+        date / sender_last4 must be equal, seconds must be within ±30 min and
+        amount within ±50. A filter left as None is not applied.
+        """
+        filters = {"sender_last4": sender_last4, "seconds": seconds, "amount": amount}
+        return self.match(date, filters, limit=limit).exact
+
+    def match(self, date=None, exact=None, fallback=None, limit=None):
+        """
+        Exact matches and, if there are none, fallback matches, in file order.
+
+        `exact` and `fallback` are filter dicts (sender_last4 / seconds /
+        amount, as in search). One pass over the candidate rows of `date`
+        yields the exact matches, the fallback matches and the diagnostic
+        counts, so a miss costs the same as a hit. Returns a MatchResult;
+        its fallback list is empty whenever exact is not.
+        """
+        filter_sets = [self._resolve(exact or {})]
+        if fallback is not None:
+            filter_sets.append(self._resolve(fallback))
+
+        result = MatchResult(date_count=self.count_on(date) if date is not None else len(self.columns))
+        with timed("index.candidates"):
+            candidates, ordered = self._candidates(date, [f for f in filter_sets if f])
+        if candidates is None:
+            return result
+        result.candidates = len(candidates)
+
+        with timed("index.filter"):
+            if _use_numpy(len(candidates)):
+                exact_rows, fallback_rows = self._filter_numpy(candidates, ordered, filter_sets)
+            else:
+                exact_rows, fallback_rows = self._filter_python(candidates, ordered, filter_sets, limit)
+
+        columns = self.columns
+        with timed("index.rows"):
+            result.exact = [columns.row(r) for r in exact_rows[:limit]]
+            if not result.exact:
+                result.fallback = [columns.row(r) for r in fallback_rows[:limit]]
+        return result
+
+    def rank(self, date=None, filters=None, limit=10):
+        """
+        Transactions closest to the filters, best first, as (score, row) pairs.
+
+        score = |time delta| / 30 min + |amount delta| / 50 + last4 mismatch,
+        each term weighted by RANK_WEIGHTS (0 is a perfect match). Rows with
+        no valid time or amount are skipped when that filter is given. Only
+        the best `limit` rows are kept, via a bounded heap.
+        """
+        filters = filters or {}
+        seconds = filters.get("seconds")
+        amount = filters.get("amount")
+        sender_last4 = filters.get("sender_last4")
+        if limit is None or limit <= 0:
+            return []
+
+        columns = self.columns
+        last4_code = None
+        if sender_last4 is not None:
+            # an unknown last4 simply mismatches every row
+            last4_code = columns.categories['sender_last4'].code_of(sender_last4)
+            if last4_code is None:
+                last4_code = -1
+
+        if date is None:
+            candidates = range(len(columns))
+        else:
+            index = self.by_date.get(date)
+            if index is None:
+                return []
+            candidates = index.rows
+
+        with timed("index.rank"):
+            if _use_numpy(len(candidates)):
+                best = self._rank_numpy(candidates, last4_code, seconds, amount, limit)
+            else:
+                best = heapq.nsmallest(limit, self._scores(candidates, last4_code, seconds, amount))
+        return [(score, columns.row(r)) for score, r in best]
+
+    def _scores(self, candidates, last4_code, seconds, amount):
+        columns = self.columns
+        row_seconds, row_amounts = columns.seconds, columns.amounts
+        row_last4 = columns.categories['sender_last4'].codes
+        w_time, w_amount, w_last4 = (
+            RANK_WEIGHTS["time"], RANK_WEIGHTS["amount"], RANK_WEIGHTS["last4"]
+        )
+        for r in candidates:
+            score = 0.0
+            if seconds is not None:
+                s = row_seconds[r]
+                if s < 0:
+                    continue
+                score += w_time * abs(s - seconds) / TIME_WINDOW_SECONDS
+            if amount is not None:
+                a = row_amounts[r]
+                if a != a:  # NaN
+                    continue
+                score += w_amount * abs(a - amount) / AMOUNT_WINDOW
+            if last4_code is not None and row_last4[r] != last4_code:
+                score += w_last4
+            yield score, r
+
+    def _rank_numpy(self, candidates, last4_code, seconds, amount, limit):
+        """Vectorised _scores + top-k; ties broken by row id like the heap"""
+        views = self.columns.numpy_views()
+        if isinstance(candidates, range):
+            rows = np.arange(candidates.start, candidates.stop, dtype=np.int32)
+        else:
+            rows = np.frombuffer(candidates, dtype=np.int32)
+
+        scores = np.zeros(len(rows), dtype=np.float64)
+        valid = np.ones(len(rows), dtype=bool)
+        if seconds is not None:
+            row_seconds = views["seconds"][rows]
+            valid &= row_seconds >= 0
+            scores += RANK_WEIGHTS["time"] * np.abs(row_seconds - seconds) / TIME_WINDOW_SECONDS
+        if amount is not None:
+            row_amounts = views["amounts"][rows]
+            valid &= ~np.isnan(row_amounts)
+            scores += RANK_WEIGHTS["amount"] * np.abs(row_amounts - amount) / AMOUNT_WINDOW
+        if last4_code is not None:
+            mismatch = views["last4"][rows] != last4_code
+            scores[mismatch] += RANK_WEIGHTS["last4"]
+
+        rows, scores = rows[valid], scores[valid]
+        if len(rows) > limit:
+            # keep everything tied with the k-th score, then order exactly
+            kth = np.partition(scores, limit - 1)[limit - 1]
+            keep = scores <= kth
+            rows, scores = rows[keep], scores[keep]
+        order = np.lexsort((rows, scores))[:limit]
+        return list(zip(scores[order].tolist(), rows[order].tolist()))
+
+    def _resolve(self, filters):
+        """Filter dict -> (last4_code, seconds, amount), or None if it cannot match"""
+        last4_code = None
+        sender_last4 = filters.get("sender_last4")
+        if sender_last4 is not None:
+            last4_code = self.columns.categories['sender_last4'].code_of(sender_last4)
+            if last4_code is None:
+                return None
+        return (last4_code, filters.get("seconds"), filters.get("amount"))
+
+    def _candidates(self, date, filter_sets):
+        """
+        Smallest index range that contains every row any filter set can match.
+
+        Returns (candidates, ordered) where ordered means already in row
+        order, or (None, True) when nothing can match.
+        """
+        if not filter_sets:
+            return None, True
+        if date is None:
+            return range(len(self.columns)), True
+
+        index = self.by_date.get(date)
+        if index is None:
+            return None, True
+
+        def shared(position):
+            values = {f[position] for f in filter_sets}
+            return values.pop() if len(values) == 1 else None
+
+        last4_code, seconds, amount = shared(0), shared(1), shared(2)
+        candidates, ordered = index.rows, True
+        if last4_code is not None:
+            candidates = index.last4_range(last4_code)
+        if seconds is not None:
+            in_window = index.time_range(seconds)
+            if len(in_window) < len(candidates):
+                candidates, ordered = in_window, False
+        if amount is not None:
+            in_window = index.amount_range(amount)
+            if len(in_window) < len(candidates):
+                candidates, ordered = in_window, False
+        return candidates, ordered
+
+    def _filter_python(self, candidates, ordered, filter_sets, limit):
+        """Single pass; stops early once the exact matches fill `limit`"""
+        exact = filter_sets[0]
+        fallback = filter_sets[1] if len(filter_sets) > 1 else None
+        exact_rows, fallback_rows = [], []
+        matches = self._matches
+
+        for r in candidates:
+            if exact is not None and matches(r, *exact):
+                exact_rows.append(r)
+                if ordered and limit is not None and 0 < limit <= len(exact_rows):
+                    break
+            elif fallback is not None and not exact_rows and matches(r, *fallback):
+                fallback_rows.append(r)
+
+        if not ordered:
+            exact_rows.sort()
+            fallback_rows.sort()
+        return exact_rows, fallback_rows
+
+    def _filter_numpy(self, candidates, ordered, filter_sets):
+        """
+        Same predicates as _matches, evaluated as boolean masks over the
+        candidate rows; masks shared by both filter sets are computed once.
+        """
+        views = self.columns.numpy_views()
+        if isinstance(candidates, range):
+            rows = np.arange(candidates.start, candidates.stop, dtype=np.int32)
+        else:
+            rows = np.frombuffer(candidates, dtype=np.int32)
+
+        gathered = {}
+        masks = {}
+
+        def column(name):
+            if name not in gathered:
+                gathered[name] = views[name][rows]
+            return gathered[name]
+
+        def mask(kind, value):
+            key = (kind, value)
+            if key not in masks:
+                if kind == "last4":
+                    masks[key] = column("last4") == value
+                elif kind == "seconds":
+                    row_seconds = column("seconds")
+                    masks[key] = (row_seconds >= 0) & (np.abs(row_seconds - value) <= TIME_WINDOW_SECONDS)
+                else:
+                    # NaN amounts compare False, as in the pure-Python path
+                    masks[key] = np.abs(column("amounts") - value) <= AMOUNT_WINDOW
+            return masks[key]
+
+        results = [[], []]
+        for position, filters in enumerate(filter_sets):
+            if filters is None:
+                continue
+            last4_code, seconds, amount = filters
+            selected = np.ones(len(rows), dtype=bool)
+            if last4_code is not None:
+                selected &= mask("last4", last4_code)
+            if seconds is not None:
+                selected &= mask("seconds", seconds)
+            if amount is not None:
+                selected &= mask("amount", amount)
+            hits = rows[selected]
+            if not ordered:
+                hits = np.sort(hits)
+            results[position] = hits.tolist()
+        return results
+
+    def _matches(self, row, last4_code, seconds, amount):
+        columns = self.columns
+        if last4_code is not None and columns.categories['sender_last4'].codes[row] != last4_code:
+            return False
+        if seconds is not None:
+            row_seconds = columns.seconds[row]
+            if row_seconds < 0 or not abs(row_seconds - seconds) <= TIME_WINDOW_SECONDS:
+                return False
+        if amount is not None:
+            if not abs(columns.amounts[row] - amount) <= AMOUNT_WINDOW:
+                return False
+        return True
+
+    def nbytes(self):
+        """Approximate bytes held by the index arrays"""
+        return sum(index.nbytes() for index in self.by_date.values())
+
+
+# ==========================================
+# SNAPSHOT
+# ==========================================
+
+class TransactionSnapshot:
+    """
+    Immutable in-memory view of one fully loaded version of the data.
+
+    Readers grab a snapshot once per request and work on it; a reload never
+    mutates an existing snapshot, it builds a new one and swaps the reference.
+    `transactions` may be any iterable of dicts; rows are encoded into
+    columns as they stream in and the dicts are not kept.
+    """
+
+    def __init__(self, transactions, version=0, signature=None):
+        self.columns = TransactionColumns(transactions)
+        self.index = TransactionIndex(self.columns)
+        self.version = version
+        self.signature = signature
+        self.loaded_at = time.time()
+
+    def __len__(self):
+        return len(self.columns)
+
+    def count_on(self, date):
+        return self.index.count_on(date)
+
+    def search(self, **filters):
+        return self.index.search(**filters)
+
+    def match(self, date=None, exact=None, fallback=None, limit=None):
+        return self.index.match(date, exact, fallback, limit)
+
+    def rank(self, date=None, filters=None, limit=10):
+        return self.index.rank(date, filters, limit)
+
+    def nbytes(self):
+        return self.columns.nbytes() + self.index.nbytes()
+
+
+class LayeredSnapshot:
+    """
+    A loaded snapshot plus the rows ingested since, as one immutable view.
+
+    `segments` are TransactionSnapshots of appended rows, oldest first.
+    Every query runs on each layer and the results are concatenated, so
+    they come back in the order they would have from a single file: base
+    rows first, then ingested rows in arrival order.
+
+    `position` is the number of rows ingested so far and `date_positions`
+    the position after the last batch that touched each date; with
+    `ingest_epoch` they tag the ingested data (see dataset_version).
+    """
+
+    def __init__(self, base, segments, version=0, signature=None,
+                 ingest_epoch="", position=0, date_positions=None):
+        self.base = base
+        self.segments = tuple(segments)
+        self.layers = (base,) + self.segments
+        self.version = version
+        self.signature = signature
+        self.ingest_epoch = ingest_epoch
+        self.position = position
+        self.date_positions = date_positions or {}
+        self.loaded_at = time.time()
+        self._count = sum(len(layer) for layer in self.layers)
+
+    def __len__(self):
+        return self._count
+
+    def count_on(self, date):
+        return sum(layer.count_on(date) for layer in self.layers)
+
+    def search(self, date=None, sender_last4=None, seconds=None, amount=None, limit=None):
+        filters = {"sender_last4": sender_last4, "seconds": seconds, "amount": amount}
+        return self.match(date, filters, limit=limit).exact
+
+    def match(self, date=None, exact=None, fallback=None, limit=None):
+        # A layer only reports fallback rows when it has no exact ones, so
+        # they are all valid whenever no layer matched exactly
+        result = MatchResult()
+        fallback_rows = []
+        for layer in self.layers:
+            part = layer.match(date, exact, fallback, limit)
+            result.date_count += part.date_count
+            result.candidates += part.candidates
+            result.exact += part.exact
+            fallback_rows += part.fallback
+        result.exact = result.exact[:limit]
+        if not result.exact:
+            result.fallback = fallback_rows[:limit]
+        return result
+
+    def rank(self, date=None, filters=None, limit=10):
+        if limit is None or limit <= 0:
+            return []
+        # Each layer's list is sorted by score; merging keeps row order on ties
+        per_layer = [layer.rank(date, filters, limit) for layer in self.layers]
+        return list(heapq.merge(*per_layer, key=lambda pair: pair[0]))[:limit]
+
+    def nbytes(self):
+        return sum(layer.nbytes() for layer in self.layers if hasattr(layer, "nbytes"))
+
+
+def _compaction_run(segments):
+    """
+    Position of the first ingested segment worth merging, or None.
+
+    A segment at most twice the size of the next one is merged with every
+    newer segment, so sizes stay geometric: O(log n) segments to query,
+    each row is re-encoded O(log n) times, and a burst of small batches
+    is folded in one pass.
+    """
+    for position in range(len(segments) - 1):
+        if len(segments[position]) <= 2 * len(segments[position + 1]):
+            return position
+    return None
+
+
+def _merge_segments(segments):
+    rows = chain.from_iterable(
+        (segment.columns.row_dict(r) for r in range(len(segment))) for segment in segments
+    )
+    return TransactionSnapshot(rows)
+
+
+# ==========================================
+# STORE
+# ==========================================
+
+def dataset_version(snapshot, date=None):
+    """
+    Opaque tag for the data a snapshot was loaded from.
+
+    Combines the reload counter with a hash of the source signature, so it
+    also changes across server restarts when the file changed meanwhile.
+    With a date the tag covers only that date's rows: ingesting rows for
+    other dates leaves it unchanged, so cached lookups for it stay valid.
+    """
+    base = snapshot.base if isinstance(snapshot, LayeredSnapshot) else snapshot
+    digest = zlib.crc32(repr(base.signature).encode())
+    tag = f"{base.version}-{digest:08x}"
+    if base is snapshot:
+        return tag
+    position = snapshot.position if date is None else snapshot.date_positions.get(date)
+    if position is None:
+        return tag
+    # The epoch is new per process and per reset, as positions restart at 0
+    return f"{tag}+{snapshot.ingest_epoch}.{position}"
+
+
+class TransactionStore:
+    """
+    Process-wide transaction store.
+
+    The backend is loaded once on start (or on first access) and then polled
+    every `poll_interval` seconds. When its signature (mtime/size) changes
+    the new data is loaded on the watcher thread and published with a single
+    reference assignment, so lookups never wait on a load and never see a
+    half-loaded dataset.
+
+    Rows appended with ingest() are indexed on their own and layered over
+    the loaded data (LayeredSnapshot); they survive reloads of the backend.
+    Small segments are merged on a background thread.
+    """
+
+    def __init__(self, backend, poll_interval=2.0):
+        self.backend = backend
+        self.poll_interval = poll_interval
+        self._snapshot = TransactionSnapshot([])
+        self._base = self._snapshot
+        self._segments = ()
+        self._ingested = 0
+        self._ingest_generation = 0
+        self._ingest_epoch = uuid.uuid4().hex[:8]
+        self._date_positions = {}
+        self._compacting = False
+        self._loaded = False
+        self._bad_signature = None
+        self._reload_lock = threading.Lock()
+        self._ingest_lock = threading.Lock()
+        self._publish_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher = None
+
+    def start(self):
+        """Load the dataset and start the background watcher"""
+        self.reload()
+        if self._watcher is None and self.poll_interval > 0:
+            self._stop.clear()
+            self._watcher = threading.Thread(
+                target=self._watch, name="transaction-store-watcher", daemon=True
+            )
+            self._watcher.start()
+        return self
+
+    def stop(self):
+        """Stop the background watcher"""
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=self.poll_interval + 1)
+            self._watcher = None
+
+    def snapshot(self):
+        """Current snapshot; loads synchronously only on the very first call"""
+        if not self._loaded:
+            self.reload()
+        return self._snapshot
+
+    def reload(self, force=False):
+        """
+        Reload the data if it changed since the current snapshot.
+
+        Returns True when a new snapshot was published.
+        """
+        with self._reload_lock:
+            signature = self.backend.signature()
+            if self._loaded and not force and signature in (self._base.signature, self._bad_signature):
+                return False
+
+            started = time.perf_counter()
+            snapshot = self.backend.load(version=self._snapshot.version + 1, signature=signature)
+            if snapshot is None:
+                # Unreadable (probably mid-write): keep serving the old data
+                # and retry once the source changes again.
+                self._bad_signature = signature
+                self._loaded = True
+                return False
+
+            with self._publish_lock:
+                self._base = snapshot
+                self._publish()
+            self._loaded = True
+            elapsed = time.perf_counter() - started
+            observe("store.load", elapsed)
+            log.info(" Loaded %d transactions from %s (v%s, %.0f ms)",
+                     len(snapshot), self.backend.describe(), self._snapshot.version, elapsed * 1000)
+            return True
+
+    def ingest(self, transactions):
+        """
+        Append transactions without reloading; returns the number applied.
+
+        Only the new rows are encoded and indexed, as a segment next to the
+        loaded data, and the result is published like a reload: readers
+        keep the snapshot they started with. The dataset version changes,
+        but dataset_version(snapshot, date) only for the dates in the batch.
+        """
+        with self._ingest_lock:
+            started = time.perf_counter()
+            segment = TransactionSnapshot(transactions)
+            if not len(segment):
+                return 0
+            with self._publish_lock:
+                self._segments += (segment,)
+                self._ingested += len(segment)
+                # Copied, not updated: published snapshots share the old dict
+                self._date_positions = {
+                    **self._date_positions, **dict.fromkeys(segment.index.by_date, self._ingested)
+                }
+                self._publish()
+                segment_count = len(self._segments)
+                compact = not self._compacting and _compaction_run(self._segments) is not None
+                if compact:
+                    self._compacting = True
+            elapsed = time.perf_counter() - started
+            observe("store.ingest", elapsed)
+            log.info(" Ingested %d transactions (v%s, %d segment(s), %.1f ms)",
+                     len(segment), self._snapshot.version, segment_count, elapsed * 1000)
+        if compact:
+            threading.Thread(target=self._compact, name="transaction-store-compactor", daemon=True).start()
+        return len(segment)
+
+    def _compact(self):
+        """Merge segments until none qualify; the data and its version are unchanged"""
+        while True:
+            with self._publish_lock:
+                position = _compaction_run(self._segments)
+                if position is None:
+                    self._compacting = False
+                    return
+                run = self._segments[position:]
+            try:
+                started = time.perf_counter()
+                merged = _merge_segments(run)
+                observe("store.compact", time.perf_counter() - started)
+            except Exception as e:
+                log.error(" Segment compaction failed: %s", e)
+                with self._publish_lock:
+                    self._compacting = False
+                return
+            with self._publish_lock:
+                # Ingests only append; a reset in between drops the run
+                if self._segments[position:position + len(run)] == run:
+                    self._segments = (
+                        self._segments[:position] + (merged,) + self._segments[position + len(run):]
+                    )
+                    self._publish(same_data=True)
+
+    def reset_ingested(self):
+        """Drop every ingested row, e.g. when their source log was replaced"""
+        with self._ingest_lock, self._publish_lock:
+            self._segments = ()
+            self._ingested = 0
+            self._ingest_generation += 1
+            self._date_positions = {}
+            self._publish()
+
+    def ingest_stats(self):
+        with self._publish_lock:
+            return {
+                "rows": self._ingested,
+                "segments": len(self._segments),
+                "generation": self._ingest_generation,
+                "compacting": self._compacting,
+            }
+
+    def _publish(self, same_data=False):
+        """
+        Make base + ingested segments current (caller holds _publish_lock).
+
+        same_data keeps the version, e.g. after merging segments, so cached
+        results stay valid.
+        """
+        if not self._segments:
+            self._snapshot = self._base
+            return
+        current = self._snapshot
+        self._snapshot = LayeredSnapshot(
+            self._base, self._segments,
+            version=current.version if same_data else current.version + 1,
+            signature=(self._base.signature, self._ingest_generation, self._ingested),
+            ingest_epoch=f"{self._ingest_epoch}.{self._ingest_generation}",
+            position=self._ingested,
+            date_positions=self._date_positions,
+        )
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.reload()
+            except Exception as e:
+                log.error(" Transaction store reload failed: %s", e)